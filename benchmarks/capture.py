@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Measure how many lines of Gecode output per second the capture engine
+parses, for a log with lots of printed solutions.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conductor.capture import CaptureEngine  # noqa: E402
+
+CAPTURES = {'keyword':
+            {'nodes': {'regex': r"\s*nodes:\s+(?P<nodes>\d+)"},
+             'depth': {'regex': r"\s*peak depth:\s+(?P<depth>\d+)"}},
+            'general':
+            {'nodes': {'regex': r".*nodes:\s+(?P<nodes>\d+)"}}}
+
+
+def gecode_log(nsolutions):
+    lines = []
+    for i in range(nsolutions):
+        lines.append("Solution {}: {{{}}}\n"
+                     .format(i, ", ".join([str(j) for j in range(20)])))
+    lines += ["\n",
+              "Initial\n",
+              "\tpropagators:  42\n",
+              "\tbranchers:    1\n",
+              "\n",
+              "Summary\n",
+              "\truntime:      1.234 (1234.000 ms)\n",
+              "\tsolutions:    {}\n".format(nsolutions),
+              "\tpropagations: 123456\n",
+              "\tnodes:        4567\n",
+              "\tfailures:     89\n",
+              "\trestarts:     0\n",
+              "\tno-goods:     0\n",
+              "\tpeak depth:   12\n"]
+    return lines
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    lines = gecode_log(args.lines)
+
+    for name, capture in [('built-in only', {}),
+                          ('keyword captures', CAPTURES['keyword']),
+                          ('general captures', CAPTURES['general'])]:
+        engine = CaptureEngine(capture)
+        best = float("inf")
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            engine.parse(lines)
+            best = min(best, time.perf_counter() - started)
+
+        print("{:<20} {:>12,.0f} lines/s".format(name, len(lines) / best))
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Measure how long it takes to load a configuration with an experiment of
+a million combinations, and to expand all of them into commands (see
+conductor.conf.Commands), and fail if either is over budget.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conductor.conf import load_conf  # noqa: E402
+
+DEFAULT_LOAD_BUDGET_MS = 1000
+DEFAULT_EXPAND_BUDGET_S = 15
+
+
+def configuration(values):
+    """
+    A configuration with one experiment combining four options of values
+    values each (so values ** 4 combinations), with command-line and
+    environment templates and overrides for some of the values.
+    """
+    options = ['alpha', 'beta', 'gamma', 'delta']
+    experiment = {option: list(range(values)) for option in options}
+    experiment.update({
+        'combine': {'options': options,
+                    'with': 'cartesian-product'},
+        'override-settings': [{'option': option,
+                               'value': value,
+                               'settings': {'nrounds': 3}}
+                              for option in options
+                              for value in range(0, values, 2)],
+        'nrounds': 1,
+        'command': "./solver",
+        'command-args': ["--alpha={alpha}", "--beta={beta}", "-v",
+                         "{gamma}", "--delta", "{delta:>4}"],
+        'environment': {'SOLVER_{alpha}': "{beta}-{gamma}",
+                        'SEED': "1"}})
+    return {'runs': {'benchmark': {'experiments': ['benchmark'],
+                                   'output': []}},
+            'benchmark': experiment}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--values', type=int, default=32,
+                        help="values per option (default 32, giving"
+                        " 1048576 combinations)")
+    parser.add_argument('--load-budget-ms', type=int,
+                        default=DEFAULT_LOAD_BUDGET_MS)
+    parser.add_argument('--expand-budget-s', type=float,
+                        default=DEFAULT_EXPAND_BUDGET_S)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    errors, conf = load_conf(configuration(args.values))
+    loaded = time.perf_counter() - started
+    if errors:
+        sys.exit("invalid configuration: {}".format(errors))
+
+    commands = conf['experiments']['benchmark']['commands']
+    started = time.perf_counter()
+    expanded = sum(1 for _ in commands)
+    expanded_s = time.perf_counter() - started
+
+    print("{:<20} {:>8.1f} ms (budget {} ms)"
+          .format("load_conf", loaded * 1000, args.load_budget_ms))
+    print("{:<20} {:>8.2f} s  (budget {} s), {} commands, {:.2f} us each"
+          .format("expand", expanded_s, args.expand_budget_s, expanded,
+                  expanded_s / expanded * 1e6))
+
+    failed = False
+    if commands.size() != expanded:
+        print("size() gives {}".format(commands.size()))
+        failed = True
+    if loaded * 1000 > args.load_budget_ms or \
+       expanded_s > args.expand_budget_s:
+        print("over budget")
+        failed = True
+
+    sys.exit(1 if failed else 0)
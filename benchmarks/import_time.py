@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Measure how long it takes to import the conductor modules the scripts in
+bin/ need to start, and fail if it is over budget or if any module that
+should only be imported when used (like matplotlib) is imported anyway.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# What bin/conductor and bin/runner.py import before doing anything
+MODULES = ['conductor.cache',
+           'conductor.common',
+           'conductor.conf',
+           'conductor.export',
+           'conductor.generate',
+           'conductor.journal',
+           'conductor.run_experiments',
+           'conductor.scheduler',
+           'conductor.store']
+
+# Slow to import, and only needed by some features
+LAZY_MODULES = ['cerberus', 'jinja2', 'matplotlib', 'numpy', 'palettable']
+
+DEFAULT_BUDGET_MS = 250
+
+SCRIPT = """
+import sys
+{imports}
+print(" ".join(m for m in {lazy!r} if m in sys.modules))
+"""
+
+
+def time_imports(python):
+    """
+    Import all of MODULES in a fresh interpreter. Returns the wall time
+    it took and the lazy modules that got imported.
+    """
+    script = SCRIPT.format(imports="\n".join("import " + m for m in MODULES),
+                           lazy=LAZY_MODULES)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ,
+           'PYTHONPATH': os.pathsep.join([root,
+                                          os.environ.get('PYTHONPATH', '')])}
+
+    started = time.perf_counter()
+    output = subprocess.run([python, "-c", script], env=env, check=True,
+                            stdout=subprocess.PIPE,
+                            universal_newlines=True).stdout
+    return time.perf_counter() - started, output.split()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--budget-ms', type=int, default=DEFAULT_BUDGET_MS)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--python', default=sys.executable)
+    args = parser.parse_args()
+
+    # The first run warms up the file system cache and .pyc files
+    time_imports(args.python)
+    best, imported = min(time_imports(args.python)
+                         for _ in range(args.repeat))
+
+    print("{:<20} {:>8.1f} ms (budget {} ms)"
+          .format("import time", best * 1000, args.budget_ms))
+
+    failed = False
+    if imported:
+        print("imported eagerly:    ", ", ".join(imported))
+        failed = True
+    if best * 1000 > args.budget_ms:
+        print("over budget")
+        failed = True
+
+    sys.exit(1 if failed else 0)
@@ -74,7 +74,9 @@ if __name__ == '__main__':
             output_file.write(args.heading + "\n")
             log.info("TeX: %s", args.heading)
 
-        for size, runtime, failures in results:
+        for result in results:
+            size, runtime, failures = \
+                result['n'], result['runtime'], result['failures']
             if runtime == float("inf"):
                 runtime_s = args.timeout_symbol
             else:
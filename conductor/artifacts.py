@@ -0,0 +1,67 @@
+from conductor.common import STATE_DIR, write_json_atomically
+
+import hashlib
+import json
+import os
+
+import daiquiri
+
+log = daiquiri.getLogger()
+
+DEFAULT_ARTIFACTS = os.path.join(STATE_DIR, "artifacts.json")
+
+
+def inputs_digest(output_cfg, translations, rows):
+    """
+    Return a digest of everything a generated file depends on: the
+    output configuration (see conductor.conf.load_conf()), the option
+    translations and the rows of results shown in it, in order.
+    """
+    digest = hashlib.sha256()
+    for value in [output_cfg['digest'], translations, *rows]:
+        digest.update(json.dumps(value, sort_keys=True,
+                                 default=str).encode('utf-8'))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+class ArtifactTracker(object):
+    """
+    Keeps track of what each generated file (table or graph) was
+    generated from, as a digest of its inputs (see inputs_digest()), so
+    that files whose inputs have not changed since they were last
+    generated can be skipped.
+
+    If regenerate is set, every file is considered out of date.
+    """
+
+    def __init__(self, path=DEFAULT_ARTIFACTS, regenerate=False):
+        self.path = path
+        self.regenerate = regenerate
+        self.skipped = 0
+
+        try:
+            with open(path) as f:
+                self._digests = json.load(f)
+        except (OSError, ValueError):
+            self._digests = {}
+
+    def up_to_date(self, file_name, digest):
+        """
+        Whether file_name exists and was generated from inputs with the
+        given digest.
+        """
+        fresh = not self.regenerate \
+            and self._digests.get(file_name) == digest \
+            and os.path.exists(file_name)
+        if fresh:
+            log.info("%s is up to date, skipping it", file_name)
+            self.skipped += 1
+        return fresh
+
+    def record(self, file_name, digest):
+        self._digests[file_name] = digest
+
+    def save(self):
+        write_json_atomically(self.path, self._digests, indent=2,
+                              sort_keys=True)
@@ -0,0 +1,146 @@
+from conductor.common import STATE_DIR, write_json_atomically
+
+from fnmatch import fnmatch
+import hashlib
+import json
+import os
+import shutil
+
+import daiquiri
+
+log = daiquiri.getLogger()
+
+DEFAULT_CACHE_DIR = os.path.join(STATE_DIR, "cache")
+DEFAULT_CACHE_SIZE_MB = 256
+
+
+def command_line(job):
+    return " ".join([job.command, *[str(a) for a in job.args]])
+
+
+class ResultCache(object):
+    """
+    An on-disk store of job results, addressed by a hash of everything
+    that can influence a result: the command and its arguments, the
+    environment, the settings, the round and the binary itself.
+
+    Entries are stored as one JSON file each, and the least recently
+    used ones are evicted once the cache grows beyond max_size_mb.
+    If rerun is set, lookups always miss, but new results are still
+    stored.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR,
+                 max_size_mb=DEFAULT_CACHE_SIZE_MB, rerun=False):
+        self.directory = directory
+        self.max_size = max_size_mb * 1024 * 1024
+        self.rerun = rerun
+        self._binary_hashes = {}
+
+    def _binary_fingerprint(self, command):
+        path = shutil.which(command)
+        if not path:
+            return None
+
+        st = os.stat(path)
+        memo_key = (path, st.st_mtime_ns, st.st_size)
+        if memo_key not in self._binary_hashes:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            self._binary_hashes[memo_key] = digest.hexdigest()
+
+        return self._binary_hashes[memo_key]
+
+    def key(self, job):
+        contents = {'command': job.command,
+                    'args': [str(a) for a in job.args],
+                    'environment': dict(job.environment),
+                    'settings': job.settings,
+                    'round': job.round,
+                    'binary': self._binary_fingerprint(job.command)}
+        serialised = json.dumps(contents, sort_keys=True, default=str)
+        return hashlib.sha256(serialised.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def _entries(self):
+        if not os.path.isdir(self.directory):
+            return
+        for dirpath, _dirnames, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename.endswith(".json"):
+                    yield os.path.join(dirpath, filename)
+
+    def lookup(self, job):
+        """
+        Return the cached result of a job, or None.
+        """
+        if self.rerun:
+            return None
+
+        path = self._path(self.key(job))
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # Mark as recently used
+        os.utime(path)
+        log.debug("Using cached result for %s", command_line(job))
+        return entry['result']
+
+    def store(self, job, result):
+        entry = {'name': job.name,
+                 'command-line': command_line(job),
+                 'result': result}
+        write_json_atomically(self._path(self.key(job)), entry)
+
+    def invalidate(self, pattern):
+        """
+        Remove all entries where the command line or the configuration
+        matches a glob pattern. Returns the number of removed entries.
+        """
+        removed = 0
+        for path in list(self._entries()):
+            try:
+                with open(path) as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+            if fnmatch(entry.get('command-line', ""), pattern) \
+               or fnmatch(entry.get('name') or "", pattern):
+                os.remove(path)
+                removed += 1
+
+        log.info("Invalidated %d cached result(s) matching %s",
+                 removed, pattern)
+        return removed
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in
+        its maximum size.
+        """
+        entries = []
+        for path in self._entries():
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, path))
+
+        size = sum([entry_size for _, entry_size, _ in entries])
+        entries.sort()
+
+        evicted = 0
+        for _, entry_size, path in entries:
+            if size <= self.max_size:
+                break
+            os.remove(path)
+            size -= entry_size
+            evicted += 1
+
+        if evicted:
+            log.info("Evicted %d cached result(s)", evicted)
@@ -0,0 +1,150 @@
+from functools import lru_cache
+import re
+
+import daiquiri
+
+log = daiquiri.getLogger()
+
+RUNTIME_RE = r"\s*runtime:.*\((?P<timeout_ms>[0-9\.]+)\s+ms\).*"
+REASON_RE = r"\s*reason:\s+(?P<reason>.*)"
+FAILURES_RE = r"\s*failures:\s+(?P<failures>.*)"
+
+# What a capture may be converted to, by its type setting
+CAPTURE_TYPES = {'int': int,
+                 'float': float,
+                 'str': str}
+
+# Patterns on the form \s*keyword: can be dispatched on their keyword
+KEYWORD_PATTERN_RE = re.compile(r"^\\s\*(?P<keyword>[\w ]+):")
+
+# What a matcher extracts
+RUNTIME, REASON, FAILURES, CAPTURE = range(4)
+
+
+def line_keyword(stripped_line):
+    """
+    The keyword of a Gecode statistics line like "runtime: 1.2 (1200 ms)".
+    """
+    return stripped_line.partition(":")[0]
+
+
+def pattern_keyword(pattern):
+    """
+    Return the keyword a regex requires a line to have (see line_keyword),
+    or None if it cannot be told from the pattern.
+    """
+    match = KEYWORD_PATTERN_RE.match(pattern)
+    return match.group('keyword') if match else None
+
+
+class CaptureEngine(object):
+    """
+    All regexes to match against the lines of Gecode output, compiled
+    once: the built-in runtime, reason and failures ones, and the
+    user-defined captures of an experiment.
+
+    Matchers whose regex requires a given keyword (as in "nodes:") are
+    kept in a table by that keyword, so that each line is only matched
+    against the regexes that could possibly match it.
+    """
+
+    def __init__(self, capture_conf=None):
+        self._by_keyword = {}
+        self._general = []
+        self.captures = []
+        self.stops_early = True
+
+        self._add(RUNTIME, None, RUNTIME_RE)
+        self._add(REASON, None, REASON_RE)
+        self._add(FAILURES, None, FAILURES_RE)
+
+        for c_name, c in (capture_conf or {}).items():
+            use = c.get('use', 'first')
+            self._add(CAPTURE, c_name, c['regex'],
+                      convert=CAPTURE_TYPES[c.get('type', 'int')],
+                      use=use)
+            self.captures.append(c_name)
+            if use != 'first':
+                self.stops_early = False
+
+    def _add(self, kind, name, pattern, convert=None, use=None):
+        matcher = (kind, name, re.compile(pattern), convert, use)
+        keyword = pattern_keyword(pattern)
+        if keyword:
+            self._by_keyword.setdefault(keyword, []).append(matcher)
+        else:
+            self._general.append(matcher)
+
+    def _matchers(self, stripped_line):
+        matchers = self._by_keyword.get(line_keyword(stripped_line), [])
+        if self._general:
+            return [*matchers, *self._general]
+        return matchers
+
+    def parse(self, lines, stop_early=False):
+        """
+        Parse Gecode output from an iterable of lines, which is consumed
+        as it is read (e.g. straight from a running process).
+
+        If stop_early is set, parsing stops as soon as the runtime, the
+        number of failures and all captures (if they all use their first
+        match) have been found, leaving the rest of the lines unread.
+        A "reason: ... time ..." line telling that the search timed out is
+        then only seen if it comes before those, as Gecode prints it.
+        """
+        can_stop_early = stop_early and self.stops_early
+        runtime = None
+        failures = None
+        captures = {}
+
+        for line in lines:
+            stripped = line.strip()
+            if not stripped:
+                continue
+
+            for kind, name, regex, convert, use in self._matchers(stripped):
+                match = regex.match(line)
+                if not match:
+                    continue
+
+                if kind == FAILURES:
+                    failures = int(match.group('failures'))
+                # Don't match if we have timed out
+                elif kind == RUNTIME and not runtime:
+                    runtime = float(match.group('timeout_ms'))
+                elif kind == REASON:
+                    reason = match.group('reason')
+                    log.debug("Stopped search with message '%s'", reason)
+                    if "time" in reason:
+                        runtime = float("inf")
+                elif kind == CAPTURE \
+                     and not (name in captures and use == 'first'):
+                    log.debug("Re %s matched: %s", name, match)
+                    captures[name] = convert(match.group(name))
+
+            if can_stop_early and runtime and failures is not None \
+               and len(captures) == len(self.captures):
+                log.debug("Found everything, ignoring the rest of the output")
+                break
+
+        assert runtime, "Found no runtime in the input!"
+
+        return {'runtime': runtime / 1000,
+                'failures': failures,
+                'status': 'timeout' if runtime == float("inf") else 'ok',
+                **captures}
+
+
+@lru_cache(maxsize=None)
+def _cached_engine(frozen_conf):
+    return CaptureEngine({name: dict(c) for name, c in frozen_conf})
+
+
+def capture_engine(capture_conf=None):
+    """
+    Return a CaptureEngine for a capture configuration, compiling it
+    only the first time it is seen.
+    """
+    frozen_conf = tuple(sorted((name, tuple(sorted(c.items())))
+                               for name, c in (capture_conf or {}).items()))
+    return _cached_engine(frozen_conf)
@@ -0,0 +1,198 @@
+import warnings
+
+# NumPy is imported by each statistic when first used, as it is slow to
+# import and only needed once results are collated.
+
+# Resamples drawn for bootstrap confidence intervals, and the seed used
+# to draw them, so that collating the same rounds gives the same result
+BOOTSTRAP_RESAMPLES = 1000
+BOOTSTRAP_SEED = 0
+
+
+def percentile(a, q):
+    """
+    The q:th percentile (0-100) of each column of a, linearly
+    interpolated and ignoring missing (NaN) values.
+
+    Unlike numpy.nanpercentile, interpolating towards an infinite value
+    (a timed out round) gives inf rather than NaN.
+    """
+    import numpy as np
+    present = np.sum(~np.isnan(a), axis=0)
+    position = np.clip(present - 1, 0, None) * q / 100
+    below = np.floor(position).astype(int)
+    above = np.ceil(position).astype(int)
+    columns = np.arange(a.shape[1])
+
+    ordered = np.sort(a, axis=0)
+    low, high = ordered[below, columns], ordered[above, columns]
+    t = position - below
+    with np.errstate(invalid='ignore'):
+        value = np.where((t == 0) | (low == high), low,
+                         low + (high - low) * t)
+    return np.where(present > 0, value, np.nan)
+
+
+def first(a):
+    """
+    The first value present in each column of a.
+    """
+    import numpy as np
+    rows = (~np.isnan(a)).argmax(axis=0)
+    return a[rows, np.arange(a.shape[1])]
+
+
+def stdev(a):
+    """
+    The sample standard deviation of each column of a, which is inf for
+    columns with infinite values and NaN for those with fewer than two.
+    """
+    import numpy as np
+    with np.errstate(invalid='ignore'):
+        deviation = np.nanstd(a, axis=0, ddof=1)
+    return np.where(np.isinf(a).any(axis=0), np.inf, deviation)
+
+
+def geometric_mean(a):
+    import numpy as np
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.exp(np.nanmean(np.log(a), axis=0))
+
+
+def bootstrap_median(a):
+    """
+    The medians of BOOTSTRAP_RESAMPLES resamples (with replacement) of
+    the rows of a, one row of column medians per resample.
+    """
+    import numpy as np
+    n, columns = a.shape
+    rng = np.random.default_rng(BOOTSTRAP_SEED)
+    rows = rng.integers(0, n, size=(BOOTSTRAP_RESAMPLES, n))
+    # All resamples side by side as columns, to take them in one go
+    resamples = a[rows].transpose(1, 0, 2).reshape(n, -1)
+    return percentile(resamples, 50).reshape(-1, columns)
+
+
+def bootstrap_interval(q):
+    """
+    A statistic giving the q:th percentile of the bootstrapped median,
+    e.g. 2.5 for the lower end of a 95% confidence interval.
+    """
+    return lambda a: percentile(bootstrap_median(a), q)
+
+
+def minimum(a):
+    import numpy as np
+    return np.nanmin(a, axis=0)
+
+
+def maximum(a):
+    import numpy as np
+    return np.nanmax(a, axis=0)
+
+
+def arithmetic_mean(a):
+    import numpy as np
+    return np.nanmean(a, axis=0)
+
+
+def percentile_of(q):
+    return lambda a: percentile(a, q)
+
+
+# All statistics operate on an array of rounds by columns, with NaN for
+# missing values, and return a value per column.
+STATISTICS = {'first': first,
+              'median': percentile_of(50),
+              'min': minimum,
+              'max': maximum,
+              'mean': arithmetic_mean,
+              'stdev': stdev,
+              'gmean': geometric_mean,
+              'p10': percentile_of(10),
+              'p25': percentile_of(25),
+              'p75': percentile_of(75),
+              'p90': percentile_of(90),
+              'p95': percentile_of(95),
+              'p99': percentile_of(99),
+              'ci-low': bootstrap_interval(2.5),
+              'ci-high': bootstrap_interval(97.5)}
+
+ALLOWED_COLLATE_METHODS = list(STATISTICS.keys())
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def column_name(column, statistic):
+    """
+    The name of the extra column with statistic of column, usable as a
+    template variable (e.g. runtime_p95 or nodes_ci_low).
+    """
+    return "{}_{}".format(column, statistic.replace("-", "_"))
+
+
+def collate_values(values, method):
+    """
+    Collate a list of numbers with method.
+    """
+    import numpy as np
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        column = np.array(values, dtype=float).reshape(-1, 1)
+        return float(STATISTICS[method](column)[0])
+
+
+def collate(rounds, method, statistics=(), skip=()):
+    """
+    Collate the results of a list of rounds into one result.
+
+    Every numeric column is collated with method, all columns in one go,
+    and for every name in statistics a column named as by column_name()
+    is added with that statistic. Other columns are taken from the first
+    round they appear in. Columns in skip are left out.
+
+    Extra columns with values that cannot be computed (like the standard
+    deviation of one round) are left out, while such collated columns are
+    NaN. Integer columns stay integers whenever the collated value is one.
+    """
+    import numpy as np
+    columns = []
+    non_numeric = {}
+    integral = {}
+    for r in rounds:
+        for column, value in r.items():
+            if column in skip or column in non_numeric:
+                continue
+            if not is_number(value):
+                non_numeric[column] = value
+                continue
+            if column not in integral:
+                columns.append(column)
+                integral[column] = True
+            integral[column] &= isinstance(value, int)
+    columns = [c for c in columns if c not in non_numeric]
+
+    data = np.array([[r.get(c, np.nan) for c in columns] for r in rounds],
+                    dtype=float).reshape(len(rounds), len(columns))
+
+    collated = {}
+    with warnings.catch_warnings():
+        # Missing values give warnings for all-NaN slices
+        warnings.simplefilter("ignore", RuntimeWarning)
+        names = list(columns)
+        values = [STATISTICS[method](data)]
+        for statistic in statistics:
+            names += [column_name(c, statistic) for c in columns]
+            values.append(STATISTICS[statistic](data))
+
+    for name, value in zip(names, np.concatenate(values)):
+        if np.isnan(value) and name not in integral:
+            continue
+        value = float(value)
+        if integral.get(name) and value.is_integer():
+            value = int(value)
+        collated[name] = value
+
+    return {**collated, **non_numeric}
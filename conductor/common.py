@@ -1,55 +1,232 @@
 import os
-from contextlib import contextmanager
-import copy
+import functools
 import itertools
 import argparse
 import random
 import importlib
+import json
+import string
+import tempfile
 
 import daiquiri
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_pdf import PdfPages
 
 log = daiquiri.getLogger()
 
+# Where Conductor keeps its state between invocations
+STATE_DIR = ".conductor"
+# Where compiled Jinja2 templates are cached between invocations
+TEMPLATE_CACHE_DIR = os.path.join(STATE_DIR, "templates")
 
-@contextmanager
-def temp_env(environment):
+
+def make_parent_dir(path):
+    """
+    Create the directory a file is (to be) in, such as STATE_DIR, unless
+    it already exists.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+
+def write_json_atomically(path, value, **dump_args):
     """
-    Temporarily set environment variables.
+    Write value as JSON to the file path, creating its directory if need
+    be. The file is written atomically, by writing a temporary file and
+    replacing path with it, so that neither readers nor a crash ever see
+    half a file. dump_args are passed on to json.dump().
     """
-    old_env = copy.deepcopy(os.environ)
+    make_parent_dir(path)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(value, f, **dump_args)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
 
-    for key, val in environment.items():
-        os.environ[key] = str(val)
 
-    yield
+def child_env(environment):
+    """
+    Return the full environment for a child process: the environment
+    of this process with the variables in environment added on top.
+    Nothing here touches os.environ, so it is safe to call from
+    several threads at once.
+    """
+    if not environment:
+        return None
 
-    os.environ = old_env
+    return {**os.environ, **environment}
 
 
 def cartesian_product(alternatives):
     """
     Takes a dict of {"option1": [alt1, alt2, alt3], "option2": [alt1,
-    alt2, alt3]}, returns [{"option1": alt1, "option2": alt1}] etc.
+    alt2, alt3]}, generates {"option1": alt1, "option2": alt1} etc.
     """
 
     keys = list(alternatives.keys())
-    values = list(alternatives.values())
-    value_combinations = list(itertools.product(*values))
+    for value_combination in itertools.product(*alternatives.values()):
+        yield dict(zip(keys, value_combination))
 
-    combinations = []
-    for value_combination in value_combinations:
-        combination = {k: v for k, v in zip(keys, value_combination)}
-        combinations.append(combination)
 
-    return combinations
+def cartesian_product_size(alternatives):
+    """
+    The number of combinations cartesian_product(alternatives) generates.
+    """
+    size = 1
+    for values in alternatives.values():
+        size *= len(values)
+    return size
 
 
 def tuplewise(alternatives):
-    pass
+    """
+    Takes a dict of {"option1": [alt1, alt2], "option2": [alt1, alt2]},
+    generates {"option1": alt1, "option2": alt1}, then {"option1": alt2,
+    "option2": alt2}, stopping at the end of the shortest list.
+    """
+    keys = list(alternatives.keys())
+    for value_combination in zip(*alternatives.values()):
+        yield dict(zip(keys, value_combination))
+
+
+def tuplewise_size(alternatives):
+    return min([len(values) for values in alternatives.values()], default=0)
+
+
+def combination_at(alternatives, index):
+    """
+    The index:th combination generated by cartesian_product(alternatives).
+    """
+    combination = {}
+    for key, values in reversed(list(alternatives.items())):
+        index, value_index = divmod(index, len(values))
+        combination[key] = values[value_index]
+    return {key: combination[key] for key in alternatives.keys()}
+
+
+def random_sample(alternatives, samples, seed=None, accept=None):
+    """
+    Generates samples combinations of alternatives (see
+    cartesian_product()) drawn at random without replacement, in the
+    order cartesian_product() would generate them. The same seed gives
+    the same combinations.
+
+    If accept is given, only combinations for which accept(combination)
+    is true are drawn.
+    """
+    size = cartesian_product_size(alternatives)
+    rng = random.Random(seed)
+
+    if accept is None:
+        indices = rng.sample(range(size), min(samples, size))
+    else:
+        indices, seen = [], set()
+        while len(indices) < samples and len(seen) < size:
+            index = rng.randrange(size)
+            if index in seen:
+                continue
+            seen.add(index)
+            if accept(combination_at(alternatives, index)):
+                indices.append(index)
+
+    for index in sorted(indices):
+        yield combination_at(alternatives, index)
+
+
+# How many combinations to try for a pair whose greedy combination is
+# rejected in pairwise(), before giving up on covering it
+PAIRWISE_COMPLETION_TRIES = 1000
+
+
+def pairwise(alternatives, accept=None):
+    """
+    Generates combinations of alternatives such that every pair of values
+    of any two options occurs in at least one of them (a covering array
+    of strength two), usually a small fraction of the cartesian product.
+
+    Each combination starts from the first pair not yet covered, and the
+    remaining options are greedily given the value covering the most
+    new pairs. If accept is given, only combinations for which
+    accept(combination) is true are generated. If the greedy combination
+    for a pair is rejected, at most PAIRWISE_COMPLETION_TRIES other
+    values of the remaining options are tried (all of them, if there are
+    no more than that, or else drawn at random with a fixed seed), and
+    the pair is left uncovered if none is accepted.
+    """
+    keys = list(alternatives.keys())
+    values = [list(v) for v in alternatives.values()]
+    n = len(keys)
+    option_pairs = list(itertools.combinations(range(n), 2))
+
+    if not option_pairs:
+        for combination in cartesian_product(alternatives):
+            if accept is None or accept(combination):
+                yield combination
+        return
+
+    def pair(i, a, j, b):
+        return (i, a, j, b) if i < j else (j, b, i, a)
+
+    def pairs_of(test):
+        return {(i, test[i], j, test[j]) for i, j in option_pairs}
+
+    def as_combination(test):
+        return {keys[k]: values[k][test[k]] for k in range(n)}
+
+    def complete(test):
+        for k in range(n):
+            if test[k] is not None:
+                continue
+            gains = [sum(1 for m in range(n) if test[m] is not None
+                         and pair(k, v, m, test[m]) in uncovered)
+                     for v in range(len(values[k]))]
+            test[k] = gains.index(max(gains))
+        return test
+
+    rng = random.Random(0)
+
+    def completions(free):
+        ranges = [range(len(values[k])) for k in free]
+        size = 1
+        for r in ranges:
+            size *= len(r)
+        if size <= PAIRWISE_COMPLETION_TRIES:
+            return itertools.product(*ranges)
+        return ([rng.choice(r) for r in ranges]
+                for _ in range(PAIRWISE_COMPLETION_TRIES))
+
+    def accepted_completion(test):
+        free = [k for k in range(n) if test[k] is None]
+        for choice in completions(free):
+            candidate = list(test)
+            for k, v in zip(free, choice):
+                candidate[k] = v
+            if accept(as_combination(candidate)):
+                return candidate
+        return None
+
+    uncovered = {(i, a, j, b) for i, j in option_pairs
+                 for a in range(len(values[i]))
+                 for b in range(len(values[j]))}
+    order = sorted(uncovered)
+
+    for i, a, j, b in order:
+        if (i, a, j, b) not in uncovered:
+            continue
+
+        start = [None] * n
+        start[i], start[j] = a, b
+        test = complete(list(start))
+        if accept is not None and not accept(as_combination(test)):
+            test = accepted_completion(start)
+            if test is None:
+                log.debug("No accepted combination with %s=%s and %s=%s",
+                          keys[i], values[i][a], keys[j], values[j][b])
+                uncovered.discard((i, a, j, b))
+                continue
+
+        uncovered -= pairs_of(test)
+        yield as_combination(test)
 
 
 def fmt_dict(d):
@@ -75,19 +252,13 @@ def make_base_parser():
     return parser
 
 
-def deserialise_options(option_s, translations):
+def translate_options(options, translations):
     """
-    Take a serialised dictionary on the form key=value,key=value... and
-    return an actual dictionary.
-
-    translations is a dictionary of keys to key/value pairs of replacements.
+    Replace option values for display. translations is a dictionary of
+    option names to dictionaries of values and their replacements.
     """
-    pairs = option_s.split(",")
-
-    options = {}
-    for pair in pairs:
-        k, v = [s.strip() for s in pair.split("=")]
-
+    translated = {}
+    for k, v in options.items():
         translation = translations.get(k, None)
         if translation:
             for matched_v, replacement_v in translation.items():
@@ -95,10 +266,101 @@ def deserialise_options(option_s, translations):
                     log.info("Replacing %s=%s with '%s'", k, v, replacement_v)
                     v = replacement_v
 
+        translated[k] = v
+    return translated
+
+
+@functools.lru_cache(maxsize=None)
+def template_environment():
+    """
+    The Jinja2 environment all templates are compiled in, once per
+    process. Templates are loaded by their source, which is also their
+    name, and their compiled bytecode is cached in TEMPLATE_CACHE_DIR,
+    so that processes rendering the same templates (in this run, or the
+    next) do not compile them again.
+    """
+    import jinja2
+    try:
+        os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+        bytecode_cache = jinja2.FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+    except OSError as e:
+        log.warning("Not caching compiled templates: %s", e)
+        bytecode_cache = None
+    return jinja2.Environment(loader=jinja2.FunctionLoader(lambda name: name),
+                              bytecode_cache=bytecode_cache)
+
 
+@functools.lru_cache(maxsize=None)
+def compile_expression(source):
+    """
+    Compile a Jinja2 expression, such as "a > 2 and b != 'x'", from its
+    source into a function of the variables it uses, once per process.
+    """
+    return template_environment().compile_expression(source)
+
+
+@functools.lru_cache(maxsize=None)
+def compile_template(source):
+    """
+    Compile a Jinja2 template from its source, once per process.
+    """
+    return template_environment().get_template(source)
+
+
+@functools.lru_cache(maxsize=None)
+def template_variables(source):
+    """
+    The names of the variables a Jinja2 template refers to, from its
+    source.
+    """
+    import jinja2.meta
+    ast = template_environment().parse(source)
+    return frozenset(jinja2.meta.find_undeclared_variables(ast))
+
+
+def compile_format(template):
+    """
+    Parse a str.format() template once, into a function of a mapping of
+    values giving the same string as template.format(**values).
 
-        options[k] = v
-    return options
+    Fields that are plain names are substituted directly, and templates
+    without fields become constants. Fields with attributes, indices,
+    conversions or format specs are left to str.format_map().
+    """
+    parts = []
+    simple = True
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        if field is not None and \
+           not (field.isidentifier() and not spec and conversion is None):
+            simple = False
+        parts.append((literal, field))
+
+    if not simple:
+        return template.format_map
+    if all(field is None for _, field in parts):
+        constant = "".join(literal for literal, _ in parts)
+        return lambda values: constant
+    if len(parts) == 1:
+        literal, field = parts[0]
+        return lambda values: literal + format(values[field])
+
+    return lambda values: "".join([literal + format(values[field])
+                                   if field is not None else literal
+                                   for literal, field in parts])
+
+
+def pyplot():
+    """
+    Return matplotlib.pyplot, importing it with a non-interactive
+    back-end on first use. This is done lazily, as importing it takes
+    longer than most other things conductor does.
+    """
+    import matplotlib
+    # This disables interactive back-ends for
+    # Matplotlib. Maybe. Possibly. No-one seems to know what it does.
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
 
 
 def load_palette(palette_str):
@@ -125,6 +387,8 @@ def random_cycle_list(lst):
 def render_pyplot_scatter_plot(xs, ys, data_labels, file_name,
                                x_label="", y_label="", colours=None,
                                x_range=None, y_range=None):
+    plt = pyplot()
+    from matplotlib.backends.backend_pdf import PdfPages
 
     with PdfPages(file_name) as pp:
         fig, ax = plt.subplots()
@@ -1,12 +1,94 @@
-from conductor.common import cartesian_product, tuplewise
-from conductor.run_experiments import ALLOWED_COLLATE_METHODS
+from conductor.capture import CAPTURE_TYPES
+from conductor.collate import ALLOWED_COLLATE_METHODS
+from conductor.common import cartesian_product, cartesian_product_size, \
+    tuplewise, tuplewise_size, random_sample, pairwise, compile_template, \
+    compile_expression, compile_format
+from conductor.generate import SORT_ORDERS, SORT_TYPES
+from conductor.profile import PROFILE
+from conductor.run_experiments import SIZE_STRATEGIES, \
+    DEFAULT_TIMEOUT_GRACE_MS, ROUND_STRATEGIES, ADAPTIVE_COLLATE_METHODS
+
+from types import MappingProxyType
+import hashlib
+import json
+import logging
+import time
 
-import cerberus
 import daiquiri
-import jinja2
 
 log = daiquiri.getLogger()
 
+def filtered(combinations, accept):
+    if accept is None:
+        return combinations
+    return (c for c in combinations if accept(c))
+
+
+# Functions to combine settings, as combinator(options, combine, accept):
+# options are the alternatives for each option, combine the combine
+# setting, and only combinations for which accept(combination) is true
+# (if accept is given) should be generated.
+COMBINATORS = {'cartesian-product':
+               lambda options, combine, accept:
+               filtered(cartesian_product(options), accept),
+               'tuplewise':
+               lambda options, combine, accept:
+               filtered(tuplewise(options), accept),
+               'random-sample':
+               lambda options, combine, accept:
+               random_sample(options, combine['samples'], combine['seed'],
+                             accept),
+               'pairwise':
+               lambda options, combine, accept: pairwise(options, accept)}
+
+# Functions to count the combinations of a combinator without generating
+# them, as count(options, combine), if there is nothing to filter out.
+# The number of combinations of other combinators is not known up front.
+COMBINATION_COUNTS = {'cartesian-product':
+                      lambda options, combine: cartesian_product_size(options),
+                      'tuplewise':
+                      lambda options, combine: tuplewise_size(options),
+                      'random-sample':
+                      lambda options, combine:
+                      min(combine['samples'], cartesian_product_size(options))}
+
+COMBINE_SCHEMA = {'type': 'dict',
+                  'schema': {'options':
+                             {'type': 'list',
+                              'required': True},
+                             'with':
+                             {'type': 'string',
+                              'allowed': list(COMBINATORS.keys()),
+                              'default': 'cartesian-product'},
+                             # For random-sample
+                             'samples':
+                             {'type': 'integer',
+                              'min': 1},
+                             'seed':
+                             {'type': 'integer',
+                              'default': 0},
+                             # Partial combinations to leave out
+                             'exclude':
+                             {'type': 'list',
+                              'schema': {'type': 'dict'},
+                              'default': []},
+                             # A Jinja2 expression that must be true
+                             'where':
+                             {'type': 'string'}}}
+
+CAPTURE_SCHEMA = {'type': 'dict',
+                  'schema': {'regex':
+                             {'type': 'string',
+                              'required': True},
+                             'use':
+                             {'type': 'string',
+                              'allowed': ['first', 'last'],
+                              'default': 'first'},
+                             'type':
+                             {'type': 'string',
+                              'allowed': list(CAPTURE_TYPES.keys()),
+                              'default': 'int'}}}
+
 CONF_SCHEMA = {'global': {'type': 'dict'},
                'runs': {'type': 'dict'}}
 
@@ -31,10 +113,34 @@ EXPERIMENT_SCHEMA = {'type': 'dict',
                                 {'type': 'boolean',
                                  'default': True,
                                  'required': True},
+                                'max-jobs':
+                                {'type': 'integer',
+                                 'min': 1,
+                                 'required': False},
                                 'nrounds':
                                 {'type': 'integer',
                                  'default': 1,
                                  'required': False},
+                                'rounds':
+                                {'type': 'string',
+                                 'allowed': ROUND_STRATEGIES,
+                                 'default': 'fixed',
+                                 'required': False},
+                                'min-rounds':
+                                {'type': 'integer',
+                                 'min': 2,
+                                 'default': 3,
+                                 'required': False},
+                                'max-rounds':
+                                {'type': 'integer',
+                                 'min': 2,
+                                 'default': 30,
+                                 'required': False},
+                                'ci-width':
+                                {'type': 'number',
+                                 'min': 0,
+                                 'default': 0.05,
+                                 'required': False},
                                 'run-at-least':
                                 {'type': 'integer',
                                  'default': 1,
@@ -54,15 +160,49 @@ EXPERIMENT_SCHEMA = {'type': 'dict',
                                  'required': False},
                                 'step-size':
                                 {'type': 'integer',
+                                 'min': 1,
                                  'default': 1,
                                  'required': False},
+                                'statistics':
+                                {'type': 'list',
+                                 'allowed': ALLOWED_COLLATE_METHODS,
+                                 'default': [],
+                                 'required': False},
+                                'stop-when-captured':
+                                {'type': 'boolean',
+                                 'default': False,
+                                 'required': False},
+                                'sweep':
+                                {'type': 'string',
+                                 'allowed': list(SIZE_STRATEGIES.keys()),
+                                 'default': 'linear',
+                                 'required': False},
+                                'sweep-points':
+                                {'type': 'integer',
+                                 'min': 1,
+                                 'default': 10,
+                                 'required': False},
+                                # No default, as commands without one
+                                # are never killed
                                 'timeout-ms':
                                 {'type': 'integer',
-                                 'default': 1,
+                                 'min': 0,
+                                 'required': False},
+                                'timeout-grace-ms':
+                                {'type': 'integer',
+                                 'min': 0,
+                                 'default': DEFAULT_TIMEOUT_GRACE_MS,
+                                 'required': False},
+                                'cpu-limit-s':
+                                {'type': 'integer',
+                                 'min': 1,
+                                 'required': False},
+                                'memory-limit-mb':
+                                {'type': 'integer',
+                                 'min': 1,
                                  'required': False},
                                 'combine':
-                                {'type': 'dict',
-                                 # Fixme: validate members
+                                {**COMBINE_SCHEMA,
                                  'required': False},
                                 'environment':
                                 {'type': 'dict',
@@ -70,18 +210,221 @@ EXPERIMENT_SCHEMA = {'type': 'dict',
                                 'capture':
                                 {'type': 'dict',
                                  'default': {},
-                                 # FIXME validate members
+                                 'valuesrules': CAPTURE_SCHEMA,
                                  'required': False},
                      }
 }
 
-# Functions to combine settings
-COMBINATORS = {'cartesian-product': cartesian_product,
-               'tuplewise': tuplewise}
+
+def matches(value, pattern):
+    if isinstance(pattern, list):
+        return value in pattern
+    return value == pattern
+
+
+def combination_filter(combine):
+    """
+    Return a function telling if a combination of options passes the
+    filters of a combine setting, or None if it has none. A combination
+    passes if it matches none of the partial combinations in exclude
+    (where a list matches any of its values), and the expression in
+    where, if any, is true for it.
+    """
+    excluded = combine.get('exclude', [])
+    where = combine.get('where')
+    if not excluded and not where:
+        return None
+
+    condition = compile_expression(where) if where else None
+
+    def accept(combination):
+        for pattern in excluded:
+            if all(matches(combination.get(option), value)
+                   for option, value in pattern.items()):
+                return False
+        return condition is None or bool(condition(**combination))
+
+    return accept
+
+
+class Commands(object):
+    """
+    The commands of an experiment, one for each combination of its
+    options, as dicts of 'command', 'args', 'environment' (a read-only
+    mapping), 'option-combination' and 'settings'.
+
+    Commands are generated lazily, one at a time, each time this is
+    iterated over, so that any number of combinations can be run in
+    constant memory. size() tells how many there are, when that can be
+    told without generating them.
+    """
+
+    def __init__(self, combine, options, settings, global_settings,
+                 command_template, args_templates, environment_template,
+                 global_environment, overrides):
+        self.combine = combine
+        self.options = options
+        self.settings = settings
+        self.global_settings = global_settings
+        self.command_template = command_template
+        self.args_templates = args_templates
+        self.environment_template = environment_template
+        self.global_environment = global_environment
+        self.overrides = overrides
+        self._accept = combination_filter(combine)
+
+        # Everything that does not vary between combinations is done once
+        self._options = {**global_settings, **settings}
+        self._command = compile_format(command_template)
+        self._args = [compile_format(arg) for arg in args_templates]
+        self._environment = [(compile_format(key), compile_format(val))
+                             for key, val in environment_template.items()]
+        self._overrides = index_overrides(overrides)
+        # Settings of each set of overrides that applied, merged
+        self._merged = {}
+
+    def size(self):
+        """
+        The number of commands, or None if they would have to be
+        generated to tell (if they are filtered, or counting the
+        combinations of the combinator would take generating them).
+        """
+        count = COMBINATION_COUNTS.get(self.combine['with'])
+        if count and self._accept is None:
+            return count(self.options, self.combine)
+        return None
+
+    def _combinations(self):
+        return COMBINATORS[self.combine['with']](self.options, self.combine,
+                                                 self._accept)
+
+    def __iter__(self):
+        debug = log.isEnabledFor(logging.DEBUG)
+        combinations = self._combinations()
+        if not PROFILE.enabled:
+            for option_combination in combinations:
+                yield self._expand(option_combination, debug)
+            return
+
+        # Combinations are generated as they are needed, so generating
+        # each is timed along with expanding it
+        while True:
+            started = time.monotonic()
+            option_combination = next(combinations, None)
+            if option_combination is None:
+                break
+            command = self._expand(option_combination, debug)
+            PROFILE.record('expand', time.monotonic() - started)
+            yield command
+
+    def _overridden(self, option_combination, debug):
+        """
+        The settings to use for option_combination, with any overrides
+        applied, and the overrides alone.
+        """
+        applied = []
+        for option_value in option_combination.items():
+            try:
+                if option_value in self._overrides:
+                    applied.append(option_value)
+            except TypeError:
+                # Unhashable values cannot have overrides
+                continue
+        if not applied:
+            return self.settings, None
+
+        if debug:
+            for option, value in applied:
+                log.debug("Using override options for %s=%s: for settings"
+                          " %s", option, value,
+                          ", ".join(self._overrides[(option, value)].keys()))
+
+        applied = tuple(applied)
+        if applied not in self._merged:
+            overrides = {}
+            for option_value in applied:
+                overrides.update(self._overrides[option_value])
+            self._merged[applied] = ({**self.settings, **overrides},
+                                     overrides)
+        return self._merged[applied]
+
+    def _expand(self, option_combination, debug=False):
+        combined_options = {**self._options, **option_combination}
+        command_settings = self.settings
+        if self._overrides:
+            command_settings, overrides = \
+                self._overridden(option_combination, debug)
+            if overrides:
+                combined_options.update(overrides)
+
+        environment = self.global_environment.copy()
+        for key, val in self._environment:
+            environment[key(combined_options)] = val(combined_options)
+
+        return {'environment': MappingProxyType(environment),
+                'command': self._command(combined_options),
+                'args': [arg(combined_options) for arg in self._args],
+                'option-combination': option_combination,
+                'settings': command_settings.copy()}
+
+
+def index_overrides(overrides):
+    """
+    Index override-settings by (option, value), merging the settings of
+    overrides for the same option and value in the order given.
+    """
+    index = {}
+    for override in overrides:
+        key = (override['option'], override['value'])
+        index[key] = {**index.get(key, {}), **override['settings']}
+    return index
+
+
+def output_digest(output):
+    """
+    A digest of an output configuration, as written in the configuration
+    file, identifying what it generates.
+    """
+    serialised = json.dumps(output, sort_keys=True, default=str)
+    return hashlib.sha256(serialised.encode('utf-8')).hexdigest()
+
+
+def sort_by(entries):
+    """
+    Normalise the sort-by setting of an output: a column or a list of
+    them, each given by its name or as a dict of its key, order (asc or
+    desc, default asc) and type (see conductor.generate.SORT_TYPES,
+    default numeric). Returns a list of such dicts, or raises ValueError.
+    """
+    if not isinstance(entries, list):
+        entries = [entries]
+
+    normalised = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            entry = {'key': entry}
+        if 'key' not in entry:
+            raise ValueError("missing key in {}".format(entry))
+        unknown = set(entry) - {'key', 'order', 'type'}
+        if unknown:
+            raise ValueError("unknown field(s) {}".format(
+                ", ".join(sorted(unknown))))
+        entry = {'order': 'asc', 'type': 'numeric', **entry}
+        if entry['order'] not in SORT_ORDERS:
+            raise ValueError("unallowed order {}".format(entry['order']))
+        if entry['type'] not in SORT_TYPES:
+            raise ValueError("unallowed type {}".format(entry['type']))
+        normalised.append(entry)
+    return normalised
+
 
 def handle_template(output, templ_heading):
+    # The sources are kept for rendering in other processes, as compiled
+    # templates cannot be pickled
     if templ_heading in output:
-        output[templ_heading] = jinja2.Template(output[templ_heading])
+        output.setdefault('template-sources', {})[templ_heading] = \
+            output[templ_heading]
+        output[templ_heading] = compile_template(output[templ_heading])
 
 
 def load_conf(conf_dict):
@@ -93,6 +436,10 @@ def load_conf(conf_dict):
         any) and an empty dict for the configuration, or an empty dict
         of validation errors and the parsed configuration as a dict.
     """
+    # Imported here, as it is slow to import and not needed to run
+    # conductor --help, or to export results
+    import cerberus
+    from jinja2 import TemplateSyntaxError
     v = cerberus.Validator(CONF_SCHEMA,
                            ignore_none_values=True,
                            update=True,
@@ -109,8 +456,15 @@ def load_conf(conf_dict):
             outputs = run_content.get("output")
 
             for output in outputs:
+                output['digest'] = output_digest(output)
                 for field in ['heading', 'row-format', 'file', 'label']:
                     handle_template(output, field)
+                if 'sort-by' in output:
+                    try:
+                        output['sort-by'] = sort_by(output['sort-by'])
+                    except ValueError as e:
+                        return {run_name: [{'output': [{'sort-by': [
+                            str(e)]}]}]}, {}
 
 
         experiments = {}
@@ -118,16 +472,26 @@ def load_conf(conf_dict):
         # Only experiments remain
         for name, settings in res.items():
             experiments[name] = global_settings.copy()
-            global_environment = experiments[name].pop("environment", {})
+            global_environment = {key: str(val) for key, val in
+                                  experiments[name].pop("environment", {}).items()}
 
             combine = settings.pop("combine")
-            combinator = COMBINATORS[combine["with"]]
             command_template = settings.pop("command")
             args_templates = settings.pop("command-args")
             environment_template = settings.pop("environment", {})
 
             override_settings = settings.pop("override-settings", {})
 
+            for run_settings in [settings, *[{**settings, **o['settings']}
+                                             for o in override_settings]]:
+                collate_with = run_settings['collate-with']
+                if run_settings.get('rounds') == 'adaptive' \
+                   and collate_with not in ADAPTIVE_COLLATE_METHODS:
+                    return {name: [{'collate-with': [
+                        "must be one of {} with adaptive rounds".format(
+                            ", ".join(ADAPTIVE_COLLATE_METHODS))]}]}, {}
+            max_jobs = settings.pop("max-jobs", None)
+
             options = {}
             for option_key in combine['options']:
                 option_values = settings.pop(option_key)
@@ -135,45 +499,24 @@ def load_conf(conf_dict):
                 # special case: a range expression
                 if isinstance(option_values, str):
                     start, stop, step = [int(i) for i in option_values.split(":")]
-                    option_values = list(range(start, stop + 1, step))
+                    option_values = range(start, stop + 1, step)
 
                 options[option_key] = option_values
 
-            commands = []
-
-            for option_combination in combinator(options):
-                combined_options = {**experiments[name], **settings}
-                combined_options = {**combined_options, **option_combination}
-
-                command_settings = settings.copy()
-
-                for option, value in option_combination.items():
-                    for override in override_settings:
-                        if override['option'] == option \
-                           and override['value'] == value:
-                            log.debug("Using override options for %s=%s: for settings %s",
-                                      option, value,
-                                      ", ".join(override['settings'].keys()))
-                            command_settings = {**command_settings,
-                                                **override['settings']}
-                            combined_options = {**combined_options,
-                                                **override['settings']}
-
-                command = command_template.format(**combined_options)
-                args = [arg.format(**combined_options) for arg in args_templates]
-
-                local_environment = {key.format(**combined_options):
-                                     val.format(**combined_options)
-                                     for key, val in environment_template.items()}
-
-                environment = {**global_environment, **local_environment}
-                commands.append({'environment': environment,
-                                 'command': command,
-                                 'args': args,
-                                 'option-combination': option_combination,
-                                 'settings': command_settings})
+            if combine['with'] == 'random-sample' \
+               and 'samples' not in combine:
+                return {name: [{'combine': [{'samples': [
+                    "required when combining with random-sample"]}]}]}, {}
+            try:
+                commands = Commands(
+                    combine, options, settings, experiments[name].copy(),
+                    command_template, args_templates, environment_template,
+                    global_environment, override_settings)
+            except TemplateSyntaxError as e:
+                return {name: [{'combine': [{'where': [str(e)]}]}]}, {}
 
             experiments[name]['commands'] = commands
+            experiments[name]['max-jobs'] = max_jobs
 
         return {}, {'experiments': experiments,
                     'runs': runs}
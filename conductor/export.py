@@ -0,0 +1,42 @@
+import csv
+import json
+
+import daiquiri
+
+log = daiquiri.getLogger()
+
+
+def export_csv(store, out_file):
+    option_names = store.option_names()
+    columns = ["experiment", "configuration", *option_names,
+               *store.round_columns()]
+
+    writer = csv.DictWriter(out_file, fieldnames=columns)
+    writer.writeheader()
+    nrows = 0
+    for row in store.rounds():
+        writer.writerow(row)
+        nrows += 1
+    return nrows
+
+
+def export_jsonl(store, out_file):
+    nrows = 0
+    for row in store.rounds():
+        out_file.write(json.dumps(
+            {k: v for k, v in row.items() if v is not None}) + "\n")
+        nrows += 1
+    return nrows
+
+
+EXPORTERS = {'csv': export_csv,
+             'jsonl': export_jsonl}
+
+
+def export_rounds(store, out_file, fmt):
+    """
+    Write the raw result of every round in a ResultStore to a file, one
+    row at a time, as CSV or JSON Lines.
+    """
+    nrows = EXPORTERS[fmt](store, out_file)
+    log.info("Exported %d round(s) as %s", nrows, fmt)
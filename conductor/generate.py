@@ -1,24 +1,134 @@
 import conductor.common
+from conductor.artifacts import inputs_digest
+from conductor.profile import PROFILE
 
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import re
+import time
 
 import daiquiri
-import matplotlib
 from itertools import repeat
-# This disables interactive back-ends for
-# Matplotlib. Maybe. Possibly. No-one seems to know what it does.
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_pdf import PdfPages
 
 log = daiquiri.getLogger()
 
+# A file to generate by calling function(*args), in a worker process if
+# rendering in parallel. Everything must therefore be picklable, and
+# templates are passed as their source.
+Render = namedtuple('Render', ['file_name', 'digest', 'function', 'args'])
+
+
+class Descending(object):
+    """
+    Wraps a value so that it orders in reverse, for sorting values that
+    cannot be negated in descending order.
+    """
+    __slots__ = ['value']
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def numeric_key(value):
+    """
+    Order numbers (or strings of them) by value, before other values in
+    string order.
+    """
+    if isinstance(value, (int, float)):
+        return 0, value
+    return text_numeric_key(str(value))
+
+
+@functools.lru_cache(maxsize=4096)
+def text_numeric_key(text):
+    # Columns tend to repeat the same few strings, which are slow to fail
+    # to parse as numbers
+    try:
+        return 0, float(text)
+    except ValueError:
+        return 1, text
+
+
+def natural_key(value):
+    """
+    Order strings with the numbers in them compared by value, so that
+    e.g. n9 comes before n10.
+    """
+    return 1, tuple(int(part) if part.isdigit() else part
+                    for part in re.split(r'(\d+)', str(value)))
+
+
+def string_key(value):
+    return 1, str(value)
+
+
+# How to order the values of a column (see sort_key()), as functions of
+# a value giving (0, a number) or (1, anything else)
+SORT_TYPES = {'numeric': numeric_key,
+              'natural': natural_key,
+              'string': string_key}
+
+SORT_ORDERS = ['asc', 'desc']
+
+# Missing values are always sorted last
+MISSING = (2, None)
+
+
+def column_key(sorting):
+    """
+    The sort key function of a value in a column, sorted as given by a
+    sort-by entry (see conductor.conf.sort_by()).
+    """
+    key = SORT_TYPES[sorting['type']]
+    if sorting['order'] == 'asc':
+        return key
+
+    def descending(value):
+        kind, value = key(value)
+        return kind, -value if kind == 0 else Descending(value)
+
+    return descending
+
+
+def sort_key(sort_by):
+    """
+    The composite sort key function of a (result, setup) pair of a table
+    row, where the setup takes precedence, for the given sort-by entries.
+    Each column is decorated with its kind first, so that numbers, other
+    values and missing values never get compared to each other, and the
+    (kind, value) pairs of all columns are flattened into one tuple.
+    """
+    columns = [(sorting['key'], column_key(sorting)) for sorting in sort_by]
+
+    def key(result_and_setup):
+        result, setup = result_and_setup
+        decorated = ()
+        for column, column_key_fn in columns:
+            if column in setup:
+                decorated += column_key_fn(setup[column])
+            elif column in result:
+                decorated += column_key_fn(result[column])
+            else:
+                decorated += MISSING
+        return decorated
+
+    return key
+
 
 def plot_data_as_pdf(data, filename, x_label, y_label, legend_loc=None):
     """
     Take data on the form label: [x-values, y-values] and plot a graph
     to a given file name.
     """
+    plt = conductor.common.pyplot()
+    from matplotlib.backends.backend_pdf import PdfPages
 
     with PdfPages(filename) as pp:
         fig, ax = plt.subplots()
@@ -35,10 +145,12 @@ def plot_data_as_pdf(data, filename, x_label, y_label, legend_loc=None):
         pp.savefig()
 
 
-def generate_graph(graph_cfg, experiments, translations):
+def generate_graph(graph_cfg, store, experiments, translations,
+                   tracker=None):
     """
-    Generate a PDF graph with a given configuration and a single
-    instance of experiment data.
+    Return the Render of a PDF graph with a given configuration from
+    the results of the given experiments in a ResultStore, or nothing if
+    the graph is up to date according to tracker.
     """
     # go through data and collect it according to its label
     # dump it according to settings
@@ -53,17 +165,13 @@ def generate_graph(graph_cfg, experiments, translations):
     # we need to make this two-way: filename, lael -> (x-values, y-values)
     # label -> (x-values, y-values)
     plots = defaultdict(lambda: ([], []))
+    rows = []
 
     # For each experiment, go trough each setup then each result and
     # concatenate them into plots.
-    for experiment in experiments:
-        print(experiment)
-
-    # Finally, render the plots.
-
-    for exp_cfg_s, exp_results in experiments:
-        exp_cfg = conductor.common.deserialise_options(exp_cfg_s, translations)
-        print(exp_cfg_s)
+    for options, exp_results in store.configurations(experiments):
+        exp_cfg = conductor.common.translate_options(options, translations)
+        rows.append((options, exp_results))
         rendered_label = label_pattern.render(**exp_cfg)
         log.info("Adding plot with label %s", rendered_label)
 
@@ -87,82 +195,143 @@ def generate_graph(graph_cfg, experiments, translations):
         old_xs, old_ys = plots[rendered_label]
         plots[rendered_label] = ([*old_xs, *xs], [*old_ys, *ys])
 
+    # Finally, render the plots, unless nothing changed.
     filename = graph_cfg['file'].render()
-    plot_data_as_pdf(plots,
-                     legend_loc=legend_loc,
-                     filename=filename,
-                     x_label=x_label,
-                     y_label=y_label)
+    digest = inputs_digest(graph_cfg, translations, rows)
+    if tracker and tracker.up_to_date(filename, digest):
+        return []
 
+    return [Render(filename, digest, plot_data_as_pdf,
+                   (dict(plots), filename, x_label, y_label, legend_loc))]
 
-def write_table(filename, heading, table_rows):
-    log.info("Writing %d table rows to %s", len(table_rows), filename)
 
+def render_table(filename, heading, row_format, rows):
+    """
+    Render each row of a table, given as a dict of template variables,
+    with the row_format template source, and write the table.
+
+    Rows are rendered one by one as they are written. Each is rendered
+    in a context of the template globals and only the variables of the
+    row the template refers to, rather than a copy of the whole row.
+    """
+    from jinja2 import TemplateError
+    row_template = conductor.common.compile_template(row_format)
+    names = conductor.common.template_variables(row_format)
+    defaults = dict(row_template.globals)
+
+    def table_rows():
+        for row in rows:
+            variables = {name: row[name] for name in names if name in row}
+            context = row_template.new_context({**defaults, **variables},
+                                               shared=True)
+            try:
+                yield "".join(row_template.root_render_func(context))
+            except (ValueError, KeyError, TemplateError) as e:
+                log.error("Error rendering template: %s", row_format)
+                log.error("With data %s", row)
+                log.error("Exception was %s", e)
+
+    write_table(filename, heading, table_rows())
+
+
+def write_table(filename, heading, table_rows):
+    written = 0
     with open(filename, "w") as output_file:
         output_file.write(heading + '\n')
         for row in table_rows:
             output_file.write(row + "\n")
             log.debug("Wrote row: %s", row)
+            written += 1
+
+    log.info("Wrote %d table rows to %s", written, filename)
 
 
-def generate_tables(output_cfg, experiments, translations):
+def generate_tables(output_cfg, store, experiments, translations,
+                    tracker=None):
     """
-    Output one or more LaTeX tables.
+    Return the Renders of one or more LaTeX tables from the results of
+    the given experiments in a ResultStore. Tables that are up to date
+    according to tracker, an ArtifactTracker, are skipped.
     """
     heading_template = output_cfg['heading']
     timeout_symbol = output_cfg.get('timeout-symbol', None)
-    sort_by = output_cfg['sort-by']
+    sort_by = output_cfg.get('sort-by', [])
     filename_template = output_cfg['file']
-    row_template = output_cfg['row-format']
+    row_format = output_cfg['template-sources']['row-format']
 
+    renders = []
     tables = defaultdict(list)
     headings = {}
 
-    for experiment in experiments:
-        for setup_s, results in experiment.items():
-            setup = conductor.common.deserialise_options(setup_s, translations)
-            file_name = filename_template.render(**setup)
-            heading = heading_template.render(**setup)
-            headings[file_name] = heading
-            tables[file_name] += list(zip(results, repeat(setup)))
+    for options, results in store.configurations(experiments):
+        setup = conductor.common.translate_options(options, translations)
+        file_name = filename_template.render(**setup)
+        heading = heading_template.render(**setup)
+        headings[file_name] = heading
+        tables[file_name] += list(zip(results, repeat(setup)))
 
     for filename, results_and_setup in tables.items():
         heading = headings[filename]
-        table_rows = []
+        digest = inputs_digest(output_cfg, translations, results_and_setup)
+        if tracker and tracker.up_to_date(filename, digest):
+            continue
 
-        # sort everything globally
+        # sort everything globally, once on all columns
+        if sort_by:
+            results_and_setup.sort(key=sort_key(sort_by))
 
-        for sorting in sort_by[::-1]:
-            def sort_key_fn(res):
-                try:
-                    return float(res.get(sorting))
-                except ValueError:
-                    return res.get(sorting)
+        rows = [{**setup, **row} for row, setup in results_and_setup]
+        renders.append(Render(filename, digest, render_table,
+                              (filename, heading, row_format, rows)))
 
+    return renders
 
-            results_and_setup.sort(key=lambda x: sort_key_fn({**x[0], **x[1]}),
-                                   reverse=False)
 
-        # render row-by-row
-        for row, setup in results_and_setup:
-            # Render the row
-            try:
-                table_rows.append(row_template.render(**{**setup, **row}))
-            except (ValueError, KeyError) as e:
-                log.error("Error rendering template: %s", row_template)
-                log.error("With data %s", {**setup, **row})
-                log.error("Exception was %s", e)
-                continue
-
-        write_table(filename,
-                    heading,
-                    table_rows)
-
-
-def generate_output(output_cfg, experiments, translations):
+def generate_output(output_cfg, store, experiments, translations,
+                    tracker=None):
+    """
+    Return what to render to generate an output from the results of a
+    list of experiments in a ResultStore, as a list of Renders (see
+    render()). If tracker (an ArtifactTracker) is given, files whose
+    inputs did not change since they were last generated are left out.
+    """
     if output_cfg['type'] == 'graph':
-        generate_graph(output_cfg, experiments.values(), translations)
+        return generate_graph(output_cfg, store, experiments, translations,
+                              tracker)
     elif output_cfg['type'] == 'text-file':
-        generate_tables(output_cfg, experiments.values(), translations)
+        return generate_tables(output_cfg, store, experiments, translations,
+                               tracker)
     else:
         assert False, "Unknown output type %s" % output_cfg['type']
+
+
+def timed_call(function, *args):
+    """
+    Call function(*args) and return how long it took, in seconds.
+    """
+    started = time.monotonic()
+    function(*args)
+    return time.monotonic() - started
+
+
+def render(renders, jobs=1, tracker=None):
+    """
+    Render a list of files, in up to jobs worker processes, and record
+    the ones successfully written with tracker.
+    """
+    def done(render, seconds):
+        log.info("Generated %s in %.3f s", render.file_name, seconds)
+        PROFILE.record('render', seconds, item=render.file_name)
+        if tracker:
+            tracker.record(render.file_name, render.digest)
+
+    if jobs <= 1 or len(renders) <= 1:
+        for r in renders:
+            done(r, timed_call(r.function, *r.args))
+        return
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(renders))) as pool:
+        futures = [(r, pool.submit(timed_call, r.function, *r.args))
+                   for r in renders]
+        for r, future in futures:
+            done(r, future.result())
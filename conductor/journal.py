@@ -0,0 +1,89 @@
+from conductor.common import STATE_DIR, make_parent_dir
+
+import json
+import os
+
+import daiquiri
+
+log = daiquiri.getLogger()
+
+DEFAULT_JOURNAL = os.path.join(STATE_DIR, "journal.jsonl")
+
+
+def journal_key(group, job):
+    return (group, job.name, job.size, job.round)
+
+
+class Journal(object):
+    """
+    An append-only log of finished jobs, one JSON object per line, that
+    is written as the jobs finish. If resume is set, the entries of an
+    existing journal are loaded and used instead of running their jobs
+    again. Otherwise, any previous journal is discarded.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL, resume=False):
+        self.path = path
+        self._entries = {}
+
+        if resume:
+            self._load()
+        elif os.path.exists(path):
+            os.remove(path)
+
+        make_parent_dir(path)
+        self._file = open(path, "a")
+
+        # Never append to a line that was cut short
+        if self._file.tell() > 0 and not self._ends_with_newline():
+            self._file.write("\n")
+
+    def _ends_with_newline(self):
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            log.warning("No journal found in %s, starting from scratch",
+                        self.path)
+            return
+
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Most likely a line cut short by a crash
+                    log.warning("Skipping malformed journal entry %s",
+                                line.strip())
+                    continue
+                key = (entry['experiment'], entry['configuration'],
+                       entry.get('size'), entry['round'])
+                self._entries[key] = entry['result']
+
+        log.info("Resuming with %d finished job(s) from %s",
+                 len(self._entries), self.path)
+
+    def lookup(self, group, job):
+        """
+        Return the journaled result of a job, or None.
+        """
+        return self._entries.get(journal_key(group, job))
+
+    def record(self, group, job, result):
+        key = journal_key(group, job)
+        if key in self._entries:
+            return
+
+        self._entries[key] = result
+        entry = {'experiment': group,
+                 'configuration': job.name,
+                 'size': job.size,
+                 'round': job.round,
+                 'result': result}
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
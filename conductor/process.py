@@ -0,0 +1,196 @@
+from conductor.profile import PROFILE
+
+from collections import deque, namedtuple
+import os
+import signal
+import subprocess
+import threading
+import time
+
+# Keep at most this much of the error output of a command
+ERRORS_TAIL_BYTES = 64 * 1024
+# Keep at most this many lines of the output of a command
+OUTPUT_TAIL_LINES = 200
+# How long to let a command that is to be stopped early exit by itself,
+# as it may well be about to, so that its exit status is not lost
+STOP_GRACE_S = 0.05
+
+ProcessResult = namedtuple('ProcessResult', ['returncode', 'result',
+                                             'consume_error', 'output',
+                                             'errors', 'rusage', 'killed',
+                                             'stopped', 'wall_time'])
+
+
+def exit_code(status):
+    """
+    Turn a wait status into a return code, negative for signals as in
+    the subprocess module.
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def read_tail(stream, tail, limit=ERRORS_TAIL_BYTES):
+    """
+    Read a stream to its end, keeping the last limit bytes in the
+    bytearray tail.
+    """
+    for chunk in iter(lambda: stream.read(4096), b""):
+        tail.extend(chunk)
+        if len(tail) > limit:
+            del tail[:len(tail) - limit]
+
+
+def iter_lines(stream, tail, counts=None, state=None):
+    """
+    Generate the decoded lines of a binary stream as they arrive,
+    remembering the last ones in the deque tail. The lines read are
+    counted in counts['lines'], if given, and state['eof'] is set once
+    the end of the stream has been reached, if given.
+    """
+    for raw_line in stream:
+        line = raw_line.decode('utf-8', errors='replace')
+        tail.append(line)
+        if counts is not None:
+            counts['lines'] += 1
+        yield line
+    if state is not None:
+        state['eof'] = True
+
+
+def exits_within(pid, seconds):
+    """
+    Whether the child process pid exits within seconds, without reaping
+    it.
+    """
+    if not hasattr(os, 'waitid'):
+        return False
+    deadline = time.monotonic() + seconds
+    while True:
+        if os.waitid(os.P_PID, pid,
+                     os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None:
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(seconds / 10)
+
+
+def kill_group(pid):
+    """
+    Kill the process group led by pid, which must not have been reaped.
+    """
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def run_process(cli_args, env=None, timeout_s=None, consume=None,
+                stop_early=False):
+    """
+    Run a command to completion and return a ProcessResult with its
+    return code, the last OUTPUT_TAIL_LINES lines of its output, the
+    tail of its error output, its resource usage as reported by wait4(),
+    and its wall-clock time in seconds.
+
+    The output is passed line by line to consume(lines) as it is
+    produced, and whatever consume returns ends up in result (or what it
+    raised in consume_error). If stop_early is set and consume returns
+    before the end of the output, the command is killed and stopped is
+    set in the result, unless it had already exited or been killed by
+    then. Otherwise, the rest of the output is read and thrown away.
+
+    If timeout_s is given, the command is killed after that many seconds
+    and killed is set in the result.
+
+    The command runs in a process group of its own, and killing it kills
+    the whole group, so that processes it started (e.g. from a wrapper
+    script) cannot keep running, or keep its output open.
+    """
+    started = time.monotonic()
+    proc = subprocess.Popen(cli_args,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            env=env,
+                            start_new_session=True)
+    PROFILE.record('spawn', time.monotonic() - started)
+    lock = threading.Lock()
+    state = {'exited': False, 'killed': False, 'stopped': False,
+             'eof': False}
+
+    def kill(reason):
+        with lock:
+            if not state['exited'] and not state['killed']:
+                kill_group(proc.pid)
+                state[reason] = True
+
+    watchdog = None
+    if timeout_s:
+        watchdog = threading.Timer(timeout_s, kill, args=('killed',))
+        watchdog.daemon = True
+        watchdog.start()
+
+    errors = bytearray()
+    errors_reader = threading.Thread(target=read_tail,
+                                     args=(proc.stderr, errors),
+                                     daemon=True)
+    errors_reader.start()
+
+    output = deque(maxlen=OUTPUT_TAIL_LINES)
+    result, consume_error = None, None
+    counts = {'lines': 0} if PROFILE.enabled else None
+    try:
+        # CPU time of this thread excludes waiting for output
+        parse_started = time.thread_time()
+        lines = iter_lines(proc.stdout, output, counts, state)
+        try:
+            if consume:
+                result = consume(lines)
+        except Exception as e:
+            consume_error = e
+
+        if stop_early and consume_error is None and not state['eof'] \
+           and not exits_within(proc.pid, STOP_GRACE_S):
+            kill('stopped')
+        for _ in lines:
+            pass
+        PROFILE.record('parse', time.thread_time() - parse_started)
+        reap_started = time.monotonic()
+
+        # Wait for the command to exit without reaping it, so that the
+        # watchdog can never signal a recycled pid.
+        if hasattr(os, 'waitid'):
+            os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+        with lock:
+            state['exited'] = True
+        if watchdog:
+            watchdog.cancel()
+
+        _, status, rusage = os.wait4(proc.pid, 0)
+        wall_time = time.monotonic() - started
+        PROFILE.record('reap', time.monotonic() - reap_started)
+        PROFILE.record('command', wall_time)
+        proc.returncode = exit_code(status)
+        if state['stopped'] and proc.returncode != -signal.SIGKILL:
+            # It exited by itself before the kill reached it
+            state['stopped'] = False
+        errors_reader.join()
+    finally:
+        if proc.returncode is None:
+            kill_group(proc.pid)
+            proc.wait()
+        proc.stdout.close()
+        proc.stderr.close()
+        if counts:
+            PROFILE.count('lines', counts['lines'])
+
+    return ProcessResult(returncode=proc.returncode,
+                         result=result,
+                         consume_error=consume_error,
+                         output="".join(output),
+                         errors=bytes(errors),
+                         rusage=rusage,
+                         killed=state['killed'],
+                         stopped=state['stopped'],
+                         wall_time=wall_time)
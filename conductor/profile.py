@@ -0,0 +1,151 @@
+from conductor.common import STATE_DIR, make_parent_dir
+
+from collections import defaultdict
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+DEFAULT_PROFILE = os.path.join(STATE_DIR, "profile.json")
+
+# What each phase measures, in report order
+PHASES = {'load-conf': "loading the configuration",
+          'expand': "generating and expanding a combination of options",
+          'run': "running all sweeps",
+          'job': "running a job, harness included",
+          'command': "a command, from spawning to reaping it",
+          'spawn': "spawning a command (fork and exec)",
+          'parse': "CPU time parsing output (see lines)",
+          'reap': "waiting for a command to exit after its output",
+          'generate': "collecting the results for an output",
+          'render': "rendering an artifact"}
+
+
+class Timing(object):
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def summary(self):
+        return {'count': self.count,
+                'total-s': self.total,
+                'mean-s': self.total / self.count if self.count else None,
+                'min-s': self.min if self.count else None,
+                'max-s': self.max}
+
+
+class Profile(object):
+    """
+    Timings of the phases of a conductor run (see PHASES) and counters,
+    collected from any thread once enabled. Timings of single items,
+    such as each artifact rendered, are also kept per item.
+
+    While disabled, recording does nothing.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._timings = defaultdict(Timing)
+        self._items = defaultdict(dict)
+        self._counters = defaultdict(int)
+
+    def record(self, phase, seconds, item=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._timings[phase].add(seconds)
+            if item is not None:
+                self._items[phase][item] = \
+                    self._items[phase].get(item, 0) + seconds
+
+    def count(self, counter, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[counter] += n
+
+    @contextmanager
+    def phase(self, phase, item=None):
+        """
+        Record the wall time of a block of code as phase.
+        """
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(phase, time.monotonic() - started, item)
+
+    def summary(self):
+        with self._lock:
+            phases = {phase: timing.summary()
+                      for phase, timing in self._timings.items()}
+            counters = dict(self._counters)
+            items = {phase: dict(items)
+                     for phase, items in self._items.items()}
+
+        derived = {}
+        if 'job' in phases and 'command' in phases:
+            derived['harness-overhead-s'] = phases['job']['total-s'] \
+                - phases['command']['total-s']
+        if counters.get('lines') and 'parse' in phases:
+            derived['parse-per-line-s'] = phases['parse']['total-s'] \
+                / counters['lines']
+
+        return {'phases': phases,
+                'counters': counters,
+                'derived': derived,
+                'items': items}
+
+    def report(self, out):
+        """
+        Write a summary of the profile in human-readable form to out.
+        """
+        summary = self.summary()
+        phases = summary['phases']
+        out.write("{:<10} {:>8} {:>12} {:>12} {:>12}\n"
+                  .format("phase", "count", "total (s)", "mean (ms)",
+                          "max (ms)"))
+        for phase in [*PHASES, *sorted(set(phases) - set(PHASES))]:
+            if phase not in phases:
+                continue
+            timing = phases[phase]
+            out.write("{:<10} {:>8d} {:>12.3f} {:>12.3f} {:>12.3f}  {}\n"
+                      .format(phase, timing['count'], timing['total-s'],
+                              timing['mean-s'] * 1000,
+                              timing['max-s'] * 1000,
+                              PHASES.get(phase, "")))
+
+        for counter, value in sorted(summary['counters'].items()):
+            out.write("{:<10} {:>8d}\n".format(counter, value))
+
+        derived = summary['derived']
+        if 'harness-overhead-s' in derived:
+            out.write("Harness overhead outside commands: {:.3f} s\n"
+                      .format(derived['harness-overhead-s']))
+        if 'parse-per-line-s' in derived:
+            out.write("Parsing: {:.2f} us/line\n"
+                      .format(derived['parse-per-line-s'] * 1e6))
+
+        slowest = sorted(summary['items'].get('render', {}).items(),
+                         key=lambda item: item[1], reverse=True)
+        for file_name, seconds in slowest[:10]:
+            out.write("Rendered {} in {:.3f} s\n".format(file_name, seconds))
+
+    def save(self, path=DEFAULT_PROFILE):
+        make_parent_dir(path)
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+# The profile of this process, enabled by conductor --profile
+PROFILE = Profile()
@@ -0,0 +1,226 @@
+from conductor.common import STATE_DIR, write_json_atomically
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+import os
+import time
+
+import daiquiri
+
+log = daiquiri.getLogger()
+
+DEFAULT_STATUS = os.path.join(STATE_DIR, "status.json")
+# How often to write the status file, and to log progress
+DEFAULT_STATUS_INTERVAL_S = 2
+DEFAULT_LOG_INTERVAL_S = 30
+
+
+def fmt_duration(seconds):
+    if seconds is None:
+        return "unknown"
+    return str(timedelta(seconds=round(seconds)))
+
+
+def now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+class ExperimentProgress(object):
+    """
+    How far the sweeps of one experiment have come.
+    """
+
+    def __init__(self, parallelism):
+        self.parallelism = parallelism
+        # Whether the number of configurations is known up front
+        self.known = False
+        self.configurations = 0
+        self.finished = 0
+        self.sizes = 0
+        self.rounds = 0
+        self.cached = 0
+        # Jobs run (not cached) with a known wall time, and its total
+        self.timed = 0
+        self.work_s = 0.0
+        # Jobs done in, and expected of, the finished sweeps, and the
+        # jobs done in the unfinished ones
+        self.finished_jobs = 0
+        self.finished_expected = 0
+        self.jobs = defaultdict(int)
+        # The sweeps seen so far, and the sum of their expected jobs
+        self.seen = 0
+        self.seen_expected = 0
+
+    def remaining_work_s(self):
+        """
+        Estimate the wall time the remaining jobs will take to run, one
+        at a time, from the average so far. The number of jobs of a sweep
+        is estimated by the sweep itself, corrected by how far off that
+        estimate was for the finished sweeps (which may e.g. have stopped
+        early on a timeout). Sweeps not yet started are assumed to be
+        like the ones seen so far. Without knowing how many there are,
+        there is no telling.
+        """
+        if not self.timed or not self.known:
+            return None
+
+        accuracy = self.finished_jobs / self.finished_expected \
+            if self.finished_expected else 1
+        remaining = 0
+        for sweep, done in self.jobs.items():
+            remaining += max(sweep.expected_jobs() * accuracy - done, 0)
+
+        unseen = self.configurations - self.seen
+        if unseen > 0 and self.seen:
+            remaining += unseen * accuracy * self.seen_expected / self.seen
+        return remaining * self.work_s / self.timed
+
+    def status(self, done=False):
+        remaining_s = 0 if done else self.remaining_work_s()
+        return {'configurations': self.configurations,
+                'finished-configurations': self.finished,
+                'finished-sizes': self.sizes,
+                'rounds': self.rounds,
+                'cached-rounds': self.cached,
+                'mean-round-s': self.work_s / self.timed if self.timed
+                else None,
+                'eta-s': remaining_s / self.parallelism
+                if remaining_s is not None else None}
+
+
+class Progress(object):
+    """
+    Progress of a Scheduler run: what has been done so far per
+    experiment, the throughput in runs per minute, and an estimated time
+    left per experiment and in total.
+
+    The status is written as JSON to path (atomically, so that it can be
+    watched from another shell) every interval_s seconds, and logged
+    every log_interval_s seconds.
+
+    Sweeps are added as they are started, so totals, the number of
+    configurations per experiment, should be given if known.
+    """
+
+    def __init__(self, path=DEFAULT_STATUS, totals=None,
+                 interval_s=DEFAULT_STATUS_INTERVAL_S,
+                 log_interval_s=DEFAULT_LOG_INTERVAL_S):
+        self.path = path
+        self.totals = totals or {}
+        self.interval_s = interval_s
+        self.log_interval_s = log_interval_s
+        self.jobs = 1
+        self.limits = {}
+        self._experiments = {}
+        self._running = 0
+        self._started = None
+        self._started_at = None
+        self._last_written = None
+        self._last_logged = None
+
+    def start(self, jobs, limits):
+        """
+        Start tracking a run with at most jobs jobs at once, and
+        limits[group] in each group.
+        """
+        self.jobs = jobs
+        self.limits = limits
+        self._started = time.monotonic()
+        self._started_at = now()
+        self._last_logged = self._started
+
+        for group, total in self.totals.items():
+            self._experiment(group).configurations = total
+            self._experiment(group).known = True
+
+        self._write('running')
+
+    def _experiment(self, group):
+        if group not in self._experiments:
+            parallelism = min(self.jobs, self.limits.get(group, self.jobs))
+            self._experiments[group] = ExperimentProgress(parallelism)
+        return self._experiments[group]
+
+    def add(self, group, sweep):
+        experiment = self._experiment(group)
+        if group not in self.totals:
+            experiment.configurations += 1
+        experiment.seen += 1
+        experiment.seen_expected += sweep.expected_jobs()
+        experiment.jobs[sweep] = 0
+
+    def record(self, group, sweep, job, result, fresh):
+        experiment = self._experiments[group]
+        experiment.rounds += 1
+        experiment.jobs[sweep] += 1
+        if not fresh:
+            experiment.cached += 1
+        elif 'wall_time' in result:
+            experiment.timed += 1
+            experiment.work_s += result['wall_time']
+
+    def finished(self, group, sweep):
+        experiment = self._experiments[group]
+        experiment.finished += 1
+        experiment.sizes += sweep.sizes_finished
+        experiment.finished_jobs += experiment.jobs.pop(sweep, 0)
+        experiment.finished_expected += sweep.expected_jobs()
+
+    def status(self, state='running'):
+        elapsed_s = time.monotonic() - self._started
+        done = state == 'finished'
+        experiments = {group: experiment.status(done)
+                       for group, experiment in self._experiments.items()}
+        run = sum(e.rounds - e.cached for e in self._experiments.values())
+
+        remaining = [e.remaining_work_s() for e in self._experiments.values()
+                     if e.jobs or e.seen < e.configurations or not e.known]
+        eta_s = 0 if done else \
+            None if None in remaining or not self._experiments \
+            else sum(remaining) / self.jobs
+
+        return {'state': state,
+                'started': self._started_at,
+                'updated': now(),
+                'elapsed-s': round(elapsed_s, 1),
+                'running-jobs': self._running,
+                'runs-per-minute': 60 * run / elapsed_s if elapsed_s else None,
+                'eta-s': eta_s,
+                'experiments': experiments}
+
+    def update(self, running):
+        """
+        Note that running jobs are running, and write or log the status
+        if it is time for that.
+        """
+        self._running = running
+        current = time.monotonic()
+        if current - self._last_written >= self.interval_s:
+            self._write('running')
+        if current - self._last_logged >= self.log_interval_s:
+            self._last_logged = current
+            self.log()
+
+    def log(self):
+        status = self.status()
+        finished = sum(e['finished-configurations']
+                       for e in status['experiments'].values())
+        total = sum(e['configurations']
+                    for e in status['experiments'].values())
+        rounds = sum(e['rounds'] for e in status['experiments'].values())
+        log.info("Progress: %d/%d configurations, %d rounds, %.1f runs/min,"
+                 " %s left", finished, total, rounds,
+                 status['runs-per-minute'] or 0, fmt_duration(status['eta-s']))
+        for group, experiment in status['experiments'].items():
+            log.info("  %s: %d/%d configurations, %s left", group,
+                     experiment['finished-configurations'],
+                     experiment['configurations'],
+                     fmt_duration(experiment['eta-s']))
+
+    def close(self):
+        self._running = 0
+        self._write('finished')
+
+    def _write(self, state):
+        self._last_written = time.monotonic()
+        write_json_atomically(self.path, self.status(state), indent=2)
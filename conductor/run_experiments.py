@@ -1,179 +1,615 @@
 import conductor.gather_stats
-from conductor.common import fmt_dict
-
-from statistics import median, mean
+from conductor.capture import capture_engine
+from conductor.collate import ALLOWED_COLLATE_METHODS, collate, \
+    collate_values
+from conductor.common import fmt_dict, child_env
+from conductor.process import run_process
+from conductor.profile import PROFILE
+
+from collections import namedtuple
+from math import ceil, comb, log2, sqrt
+from statistics import mean, stdev
+import signal
 import subprocess
 import sys
-import re
+import time
 
 import daiquiri
 
 log = daiquiri.getLogger()
 
 
-RUNTIME_RE = r"\s*runtime:.*\((?P<timeout_ms>[0-9\.]+)\s+ms\).*"
-REASON_RE = r"\s*reason:\s+(?P<reason>.*)"
-FAILURES_RE = r"\s*failures:\s+(?P<failures>.*)"
-# This was experimentally verified and not mentioned anywhere? YMMV
-# here.
-ERR_OOM = -9
+# Error output that means a command ran out of memory
+MEMOUT_MESSAGES = ["bad_alloc", "out of memory", "MemoryError",
+                   "Cannot allocate memory"]
+
+# How long past timeout-ms to wait before killing a command
+DEFAULT_TIMEOUT_GRACE_MS = 5000
+
+ROUND_STRATEGIES = ['fixed', 'adaptive']
+# What adaptive rounds can collate rounds with, as there is a confidence
+# interval for it (see confidence_interval())
+ADAPTIVE_COLLATE_METHODS = ['mean', 'median']
+
+# Two-sided 95% Student t quantiles by degrees of freedom; the normal
+# quantile is used past the end of the table.
+T_QUANTILES_95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306,
+                  2.262, 2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120,
+                  2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064,
+                  2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+Z_QUANTILE_95 = 1.960
 
-ALLOWED_COLLATE_METHODS = ["first", "median",
-                           "min", "max", "mean"]
+# Resource usage recorded for every run, collated like the runtime
+MEASUREMENTS = ['wall_time', 'user_time', 'system_time', 'peak_rss_mb']
+
+# A single round of a configuration, as dispatched by a Scheduler.
+Job = namedtuple('Job', ['name', 'command', 'args', 'environment',
+                         'settings', 'size', 'round'])
 
 
 class OutOfMemory(Exception):
-    pass
+    def __init__(self, measurements=None):
+        super().__init__()
+        self.measurements = measurements or {}
 
 
 class Timeout(Exception):
-    pass
+    def __init__(self, measurements=None):
+        super().__init__()
+        self.measurements = measurements or {}
 
 
-def handle_captures(line, captures, capture_conf):
-    for c_name, c in capture_conf.items():
-        convert_fn = c['type']
-        capture_re = re.compile(c['regex'])
-        match = capture_re.match(line)
+def parse_gecode_output(in_file, capture=None, stop_early=False):
+    """
+    Parse Gecode output from an iterable of lines with the captures in
+    capture. See CaptureEngine.parse().
+    """
+    return capture_engine(capture).parse(in_file, stop_early=stop_early)
 
-        if match and not (c_name in captures and c['use'] == 'first'):
-            log.debug("Re %s matched: %s", c_name, match)
-            captures[c_name] = convert_fn(match.group(c_name))
-        else:
-            log.debug("Re %s did not match", c_name)
 
+def confidence_interval(values, method):
+    """
+    Return a 95% confidence interval (low, high) for the statistic
+    collated with method over values, or None if there are too few
+    values to tell.
+
+    The median gets a distribution-free interval between two order
+    statistics, and the mean a Student t interval. Other methods (see
+    ADAPTIVE_COLLATE_METHODS) are not supported.
+    """
+    assert method in ADAPTIVE_COLLATE_METHODS, \
+        "No confidence interval for %s" % method
+
+    n = len(values)
+    if n < 2:
+        return None
+
+    if method == 'median':
+        # Widest k with P(X < k) <= 2.5% for X ~ Bin(n, 1/2); the
+        # interval is then the k:th smallest to the k:th largest value.
+        xs = sorted(values)
+        k = 0
+        tail = 0
+        while True:
+            tail += comb(n, k) / 2 ** n
+            if tail > 0.025:
+                break
+            k += 1
+        if k == 0:
+            return None
+        return xs[k - 1], xs[n - k]
+
+    df = n - 1
+    t = T_QUANTILES_95[df - 1] if df <= len(T_QUANTILES_95) \
+        else Z_QUANTILE_95
+    centre = mean(values)
+    half_width = t * stdev(values) / sqrt(n)
+    return centre - half_width, centre + half_width
+
+
+def limited(cli_args, cpu_limit_s=None, memory_limit_mb=None):
+    """
+    Return the command line cli_args run with the given resource limits.
+
+    The limits are set by a shell that then execs the command, rather
+    than in the forked child before exec (with preexec_fn), which may
+    deadlock as commands are started from several threads.
+    """
+    if not cpu_limit_s and not memory_limit_mb:
+        return cli_args
+
+    limits = []
+    if cpu_limit_s:
+        # SIGXCPU at the soft limit, SIGKILL at the hard one (which can
+        # only be lowered to the soft limit, so that goes first)
+        limits += ["ulimit -S -t {}".format(cpu_limit_s),
+                   "ulimit -H -t {}".format(cpu_limit_s + 1)]
+    if memory_limit_mb:
+        # In kilobytes
+        limits.append("ulimit -v {}".format(memory_limit_mb * 1024))
+    script = " && ".join([*limits, 'exec "$@"'])
+    return ["/bin/sh", "-c", script, "sh", *cli_args]
+
+
+def peak_rss_mb(rusage):
+    """
+    Return the peak resident set size in MB from a struct rusage.
 
+    Note that on Linux, this is never less than the resident set size of
+    the process that spawned the command at the time, as the kernel
+    counts the memory of the forked process before exec as well. It is
+    thus only meaningful for commands using more memory than conductor.
+    """
+    # ru_maxrss is in kilobytes on Linux, but in bytes on macOS
+    if sys.platform == 'darwin':
+        return rusage.ru_maxrss / (1024 * 1024)
+    return rusage.ru_maxrss / 1024
 
-def parse_gecode_output(in_file, capture=None):
-    timeout_re = re.compile(RUNTIME_RE)
-    reason_re = re.compile(REASON_RE)
-    failures_re = re.compile(FAILURES_RE)
-    runtime = None
-    reason = None
-    failures = None
-    captures = {}
 
-    for line in in_file:
-        if not line.strip():
-            continue
-        #log.debug("Read line: %s", line)
-        tout_match = timeout_re.match(line)
+def measure(proc):
+    """
+    Return the measurements of a ProcessResult: its wall-clock, user
+    CPU and system CPU times in seconds, and its peak RSS in MB.
+    """
+    return {'wall_time': proc.wall_time,
+            'user_time': proc.rusage.ru_utime,
+            'system_time': proc.rusage.ru_stime,
+            'peak_rss_mb': peak_rss_mb(proc.rusage)}
 
-        if capture:
-            handle_captures(line, captures, capture_conf=capture)
 
-        if failures_re.match(line):
-            failures = int(failures_re.match(line).group('failures'))
-            continue
+def classify_exit(proc, cpu_limit_s=None, memory_limit_mb=None):
+    """
+    Tell why a command stopped, given its ProcessResult. Returns one of
+    'ok', 'timeout', 'memout' or 'crash'.
+    """
+    if proc.killed:
+        return 'timeout'
 
-        # Don't match if we have timed out
-        if tout_match and not runtime:
-            runtime = float(tout_match.group('timeout_ms'))
-            continue
+    if proc.returncode == 0:
+        return 'ok'
 
-        if reason_re.match(line):
-            reason = reason_re.match(line).group('reason')
-            log.debug("Stopped search with message '%s'", reason)
-            if "time" in reason:
-                runtime = float("inf")
+    cpu_time = proc.rusage.ru_utime + proc.rusage.ru_stime
+    if proc.returncode == -signal.SIGXCPU \
+       or (cpu_limit_s and proc.returncode == -signal.SIGKILL
+           and cpu_time >= cpu_limit_s):
+        return 'timeout'
 
-    assert runtime, "Found no runtime in the input!"
+    errors = proc.errors.decode('utf-8', errors='replace')
+    if any([message in errors for message in MEMOUT_MESSAGES]):
+        return 'memout'
 
-    return {'runtime': runtime / 1000,
-            'failures': failures,
-            **captures}
+    # Neither we nor the CPU limit sent it. Only under a memory limit is
+    # that likely to be for running out of memory; otherwise anyone
+    # could have killed it.
+    if memory_limit_mb and proc.returncode == -signal.SIGKILL:
+        return 'memout'
 
+    return 'crash'
 
-def run_experiment(command, cmd_args, capture=None):
+
+def run_experiment(command, cmd_args, capture=None, environment=None,
+                   timeout_s=None, cpu_limit_s=None, memory_limit_mb=None,
+                   stop_early=False):
+    """
+    Run a command once and parse its output as it is produced.
+    environment holds the variables to set for the command on top of
+    those of this process.
+
+    The command is killed if it runs for longer than timeout_s seconds
+    of wall-clock time, and limited to cpu_limit_s seconds of CPU time
+    and memory_limit_mb MB of address space, if given. If stop_early is
+    set, it is also killed once everything of interest has been parsed
+    from its output.
+
+    Raises Timeout or OutOfMemory if any of these limits are hit, and
+    CalledProcessError if the command fails for any other reason.
+
+    Next to what the command reports itself, its wall-clock time, user
+    and system CPU time, and peak RSS are recorded (see measure()).
+    """
     cli_args = [command, *[str(a) for a in cmd_args]]
 
     log.debug("Invoking command %s", " ".join(cli_args))
+    proc = run_process(limited(cli_args, cpu_limit_s, memory_limit_mb),
+                       env=child_env(environment),
+                       timeout_s=timeout_s,
+                       consume=lambda lines: parse_gecode_output(
+                           lines, capture=capture, stop_early=stop_early),
+                       stop_early=stop_early)
+    measurements = measure(proc)
+    errors = proc.errors.decode('utf-8', errors='replace')
+
+    outcome = 'ok' if proc.stopped \
+        else classify_exit(proc, cpu_limit_s, memory_limit_mb)
+    if outcome == 'timeout':
+        log.error("Time limit exceeded running %s!", " ".join(cli_args))
+        raise Timeout(measurements)
+    elif outcome == 'memout':
+        log.error("Out of memory running %s!",
+                  " ".join(cli_args))
+        raise OutOfMemory(measurements)
+    elif outcome == 'crash':
+        log.error("Command %s failed with error output: %s",
+                  " ".join(cli_args), errors)
+        raise subprocess.CalledProcessError(proc.returncode, cli_args,
+                                            output=proc.output,
+                                            stderr=proc.errors)
+
+    if errors:
+        log.debug("Error output from %s: %s", " ".join(cli_args), errors)
+
+    if proc.consume_error:
+        log.error("Invalid output from command %s: %s",
+                  command,
+                  proc.output)
+        raise proc.consume_error
+
+    log.info("Captured data: %s", proc.result)
+    return {**proc.result, **measurements}
+
+
+def hard_timeout(settings):
+    """
+    Return the wall-clock time in seconds after which a command is
+    killed: timeout-ms plus a grace period of timeout-grace-ms, giving
+    the command some time to stop by itself and report its results.
+    Commands without a timeout-ms are never killed.
+    """
+    if settings.get('timeout-ms') is None:
+        return None
+
+    grace_ms = settings.get('timeout-grace-ms', DEFAULT_TIMEOUT_GRACE_MS)
+    return (settings['timeout-ms'] + grace_ms) / 1000
+
+def run_job(job):
+    """
+    Run a single round of a configuration. This is what the workers of
+    a Scheduler execute.
+    """
+    settings = job.settings
+    started = time.monotonic()
     try:
-        result = subprocess.check_output(cli_args)\
-                           .decode('utf-8').split('\n')
-        try:
-            res = parse_gecode_output(result, capture=capture)
-            log.info("Captured data: %s", res)
-            return res
-        except KeyError as e:
-            log.error("Invalid output from command %s: %s",
-                      command,
-                      ", ".join(result))
-            raise e
-    except subprocess.CalledProcessError as e:
-        # Out of memory-error
-        if e.returncode == ERR_OOM:
-            log.error("Out of memory running %s!",
-                      " ".join(cli_args))
-            raise OutOfMemory()
+        return run_experiment(job.command,
+                              job.args,
+                              capture=settings.get('capture', {}),
+                              environment=job.environment,
+                              timeout_s=hard_timeout(settings),
+                              cpu_limit_s=settings.get('cpu-limit-s'),
+                              memory_limit_mb=settings.get('memory-limit-mb'),
+                              stop_early=settings.get('stop-when-captured',
+                                                      False))
+    except Timeout as e:
+        return {'runtime': float("inf"),
+                'failures': 0,
+                'status': 'timeout',
+                **e.measurements}
+    except OutOfMemory as e:
+        return {'runtime': float("inf"),
+                # I wish there were a better solution than this!
+                'failures': 0,
+                'status': 'memout',
+                **e.measurements}
+    finally:
+        PROFILE.record('job', time.monotonic() - started)
+
+
+class LinearSizes(object):
+    """
+    Instance sizes from start to stop in steps of step-size. A timeout
+    ends the sweep if die-on-timeout is set, but never before
+    run-at-least sizes have been run.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._sizes = iter(range(settings['start'],
+                                 settings['stop'] + 1,
+                                 settings['step-size']))
+        self._nfinished = 0
+
+    def first(self):
+        return next(self._sizes, None)
+
+    def next(self, size, timed_out):
+        self._nfinished += 1
+        if timed_out and self.settings['die-on-timeout'] \
+           and self._nfinished >= self.settings.get('run-at-least', 0):
+            return None
+        return next(self._sizes, None)
+
+    def expected_sizes(self):
+        """
+        How many sizes the sweep will run at most.
+        """
+        return len(range(self.settings['start'], self.settings['stop'] + 1,
+                         self.settings['step-size']))
+
+    def select(self, series):
+        return series
+
+
+class AdaptiveSizes(object):
+    """
+    Search for the largest instance size that can be solved without a
+    timeout, then fill in sweep-points evenly spaced sizes below it.
+
+    The search first probes sizes geometrically from start (doubling
+    each time, but never beyond stop) until a timeout occurs, and then
+    bisects between the largest solved and the smallest timed out size
+    until they are at most step-size apart.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._largest_solved = None
+        self._smallest_timeout = None
+        self._seen = set()
+        self._fill = None
+
+    def first(self):
+        return self.settings['start']
+
+    def _bisect(self):
+        lo, hi = self._largest_solved, self._smallest_timeout
+        if lo is None or hi is None or hi - lo <= self.settings['step-size']:
+            return None
+        return (lo + hi) // 2
+
+    def _fill_sizes(self):
+        start, frontier = self.settings['start'], self._largest_solved
+        if frontier is None:
+            return []
+
+        npoints = self.settings.get('sweep-points', 10)
+        if npoints < 2:
+            sizes = {frontier}
         else:
-            raise e
+            sizes = {start + round(i * (frontier - start) / (npoints - 1))
+                     for i in range(npoints)}
+
+        return sorted(sizes - self._seen)
+
+    def next(self, size, timed_out):
+        self._seen.add(size)
+        if timed_out:
+            if self._smallest_timeout is None or size < self._smallest_timeout:
+                self._smallest_timeout = size
+        elif self._largest_solved is None or size > self._largest_solved:
+            self._largest_solved = size
+
+        # Probing
+        if self._smallest_timeout is None and size < self.settings['stop']:
+            return min(max(2 * size, size + self.settings['step-size']),
+                       self.settings['stop'])
+
+        if self._fill is None:
+            bisect_size = self._bisect()
+            if bisect_size is not None:
+                return bisect_size
+
+            log.info("Largest size solved in time: %s", self._largest_solved)
+            self._fill = self._fill_sizes()
+
+        return self._fill.pop(0) if self._fill else None
+
+    def expected_sizes(self):
+        """
+        A rough estimate of how many sizes the search will run: doubling
+        up to stop, bisecting the whole range, and the sweep points.
+        """
+        start = max(self.settings['start'], 1)
+        stop = max(self.settings['stop'], start)
+        span = max((stop - start) / self.settings['step-size'], 1)
+        return ceil(log2(stop / start)) + 1 + ceil(log2(span)) \
+            + self.settings.get('sweep-points', 10)
+
+    def select(self, series):
+        """
+        Sort results by instance size, keeping only the first timeout.
+        """
+        selected = []
+        for result in sorted(series, key=lambda r: r['n']):
+            selected.append(result)
+            if result['runtime'] == float("inf"):
+                break
+        return selected
+
+
+SIZE_STRATEGIES = {'linear': LinearSizes,
+                   'adaptive': AdaptiveSizes}
+
+
+class Sweep(object):
+    """
+    The instance sizes of a single configuration, each run for a number
+    of rounds. The size is passed as the last argument to the command,
+    and which sizes to run is decided by the sweep setting (see
+    SIZE_STRATEGIES).
+
+    Rounds are handed out one at a time as jobs, may finish in any
+    order, and are collated in round order once all rounds of a size are
+    done. Only then is the next size chosen, as that may depend on
+    whether the previous one timed out.
+    """
+
+    def __init__(self, name, command, args, settings, environment=None,
+                 options=None):
+        self.name = name
+        self.command = command
+        self.args = args
+        self.settings = settings
+        self.environment = environment or {}
+        self.options = options or {}
+        self.error = None
+
+        assert settings['collate-with'] in ALLOWED_COLLATE_METHODS, \
+            "Unsupported collate type %s" % settings['collate-with']
+        self._adaptive = settings.get('rounds', 'fixed') == 'adaptive'
+
+        self._sizes = SIZE_STRATEGIES[settings.get('sweep', 'linear')](settings)
+        self._series = []
+        self._start_size(self._sizes.first())
+
+    def _start_size(self, size):
+        self._size = size
+        self._rounds = {}
+        self._dispatched = 0
+        self._first_timeout = None
+        self._target = self.settings['min-rounds'] if self._adaptive \
+            else self.settings['nrounds']
+
+    def _timed_out(self):
+        return self.settings['die-on-timeout'] \
+            and self._first_timeout is not None
+
+    def _exhausted(self):
+        return self._timed_out() \
+            or self._dispatched >= self._target
+
+    def next_job(self):
+        """
+        Return the next job to run, or None if nothing more can be
+        dispatched right now.
+        """
+        if self.error or self._size is None or self._exhausted():
+            return None
+
+        job = Job(name=self.name,
+                  command=self.command,
+                  args=[*self.args, self._size],
+                  environment=self.environment,
+                  settings=self.settings,
+                  size=self._size,
+                  round=self._dispatched)
+        self._dispatched += 1
+        return job
+
+    def record(self, job, result):
+        self._rounds[job.round] = result
+
+        if result['runtime'] == float("inf") \
+           and (self._first_timeout is None or job.round < self._first_timeout):
+            self._first_timeout = job.round
+
+        if not self._exhausted() or len(self._rounds) < self._dispatched:
+            return
+
+        if self._adaptive and not self._timed_out() \
+           and self._target < self.settings['max-rounds'] \
+           and not self._precise():
+            self._target += 1
+            return
+
+        self._finish_size()
+
+    def _precise(self):
+        """
+        Whether the 95% confidence interval of the collated runtime of
+        the rounds so far is narrower than ci-width, relative to the
+        collated runtime itself.
+        """
+        runtimes = [float(r['runtime']) for r in self._rounds.values()]
+        if float("inf") in runtimes:
+            # More rounds will not make a timeout any more precise
+            return True
+
+        interval = confidence_interval(runtimes,
+                                       self.settings['collate-with'])
+        if interval is None:
+            return False
+
+        low, high = interval
+        if high - low == 0:
+            return True
+        collated = collate_values(runtimes, self.settings['collate-with'])
+        return collated != 0 \
+            and (high - low) / abs(collated) <= self.settings['ci-width']
+
+    def _finish_size(self):
+        result = self._collate()
+        log.info("Finished %s for n=%d after %d rounds: %s", self.name,
+                 self._size, len(self._rounds), fmt_dict(result))
+        self._series.append(result)
+        self._start_size(self._sizes.next(self._size,
+                                          result['runtime'] == float("inf")))
+
+    def _collate(self):
+        rounds = [self._rounds[i] for i in sorted(self._rounds)]
+
+        # Die early on timeout: rounds that ran concurrently with the
+        # one timing out are discarded to keep results deterministic.
+        if self._timed_out():
+            rounds = rounds[:self._first_timeout + 1]
+
+        result = collate(rounds, self.settings['collate-with'],
+                         self.settings.get('statistics', []),
+                         skip=('status',))
+        runtime = result.pop('runtime')
+
+        # Report why the collated runtime is infinite, if it is
+        status = 'ok'
+        if runtime == float("inf"):
+            status = next((r['status'] for r in rounds
+                           if r.get('status', 'ok') != 'ok'), 'timeout')
+
+        return {'n': self._size,
+                'runtime': runtime,
+                'failures': result.pop('failures'),
+                'status': status,
+                **result}
+
+    def fail(self, error):
+        self.error = error
+
+    @property
+    def sizes_finished(self):
+        return len(self._series)
+
+    def expected_jobs(self):
+        """
+        An estimate of the total number of jobs of the sweep, for
+        reporting progress.
+        """
+        rounds = self.settings['min-rounds'] if self._adaptive \
+            else self.settings['nrounds']
+        return self._sizes.expected_sizes() * rounds
+
+    @property
+    def finished(self):
+        return bool(self.error) or self._size is None
+
+    def results(self):
+        """
+        Return a list of [{'n': instance_size, 'runtime': ..., 'failures':
+        ..., 'status': ..., measurements..., captures...}], one for each
+        instance size that was run. See MEASUREMENTS. Numeric values are
+        collated with collate-with, and the statistics setting adds extra
+        columns, such as runtime_p95 (see conductor.collate.collate()).
+
+        Runtime is inf if a timeout or memory-out occurred, and status is
+        then 'timeout' or 'memout', respectively. Otherwise it is 'ok'.
+
+        Failures is 0 if a memory-out occurred, as that information is not
+        available in that case.
+        """
+        return self._sizes.select(list(self._series))
+
 
 def run_experiments(command, args, settings):
     """
-    Return a list of [instance_size, runtime_ms, number_of_failures]"
-
-    Runtime is inf if a timeout or memory-out occurred.
+    Run all instance sizes and rounds of a configuration serially.
 
-    Failures is 0 if a memory-out occurred, as that information is not
-    available in that case.
+    See Sweep.results() for the return format.
     """
 
     log.debug(("Running experiment command %s with arguments"
                " %s and settings %s"),
               command, ", ".join(args), fmt_dict(settings))
 
-    if settings['collate-with'] == "first":
-        collate_fn = lambda l: l[0]
-    elif settings['collate-with'] == "median":
-        collate_fn = median
-    elif settings['collate-with'] == "min":
-        collate_fn = min
-    elif settings['collate-with'] == "max":
-        collate_fn = max
-    elif settings['collate-with'] == "mean":
-        collate_fn = mean
-    else:
-        assert False, "Unsupported collate type %s" % settings['collate-with']
-
-    capture = settings.get('capture', {})
-    for c_name, _c_opts in capture.items():
-        capture[c_name]['type'] = lambda x: int(x)
-
-    results = []
-    runtimes, failures_l, res_l = [], [], []
-
-    for _ in range(0, settings['nrounds']):
-        try:
-            res = run_experiment(
-                command,
-                args,
-                capture=capture)
-            runtime = res['runtime']
-            failures = res['failures']
-
-        except OutOfMemory:
-            runtime = float("inf")
-            failures = 0  # I wish there were a better solution than this!
-
-        runtimes.append(float(runtime))
-        failures_l.append(int(failures))
-
-        del res['runtime']
-        del res['failures']
-        res_l.append(res)
-
-        # Die early on timeout
-        if settings['die-on-timeout'] and runtimes[-1] == float("inf"):
-            break
-
-    runtime = collate_fn(runtimes)
-    failures = int(collate_fn(failures_l))
-    results.append({'runtime': runtime,
-                    'failures': failures,
-                    # Fixme: this is slightly controversial: use the
-                    # captured results from the first run.
-                    **res_l[0]})
-    # if runtime == float("inf") and settings['die-on-timeout']:
-    #     raise Timeout("Timeout!")
-    return results
+    sweep = Sweep(command, command, args, settings)
+    job = sweep.next_job()
+    while job:
+        sweep.record(job, run_job(job))
+        job = sweep.next_job()
+
+    return sweep.results()
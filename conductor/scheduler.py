@@ -0,0 +1,202 @@
+from conductor.run_experiments import run_job
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from operator import length_hint
+import os
+
+import daiquiri
+
+log = daiquiri.getLogger()
+
+
+def default_jobs():
+    return os.cpu_count() or 1
+
+
+class Scheduler(object):
+    """
+    Run the jobs of a number of sweeps concurrently. The actual work
+    happens in the child processes, so a pool of worker threads waiting
+    on them is all it takes.
+
+    At most `jobs` jobs run at any one time, and at most limits[group]
+    of those belong to sweeps in the same group (i.e. experiment).
+
+    If a journal or a cache is given, they are consulted (in that order)
+    before dispatching a job, and results are recorded in them. If
+    progress (a Progress) is given, it is kept up to date as jobs finish.
+    """
+
+    def __init__(self, jobs=None, limits=None, cache=None, journal=None,
+                 progress=None):
+        self.jobs = jobs or default_jobs()
+        self.limits = {group: limit for group, limit in (limits or {}).items()
+                       if limit}
+        self.cache = cache
+        self.journal = journal
+        self.progress = progress
+        self._on_result = None
+        self._on_finished = None
+        self._total = None
+        self._nfinished = 0
+
+    def _lookup(self, group, job):
+        result = None
+        if self.journal:
+            result = self.journal.lookup(group, job)
+        if result is None and self.cache:
+            result = self.cache.lookup(job)
+        return result
+
+    def _record(self, group, sweep, job, result, fresh=True):
+        if fresh and self.cache:
+            self.cache.store(job, result)
+        if self.journal:
+            self.journal.record(group, job, result)
+        if self._on_result:
+            self._on_result(group, sweep, job, result)
+        if self.progress:
+            self.progress.record(group, sweep, job, result, fresh)
+        sweep.record(job, result)
+
+    def _has_capacity(self, running, active, group):
+        return len(running) < self.jobs \
+            and active[group] < self.limits.get(group, self.jobs)
+
+    def _dispatch_sweep(self, pool, group, sweep, running, active):
+        while self._has_capacity(running, active, group):
+            job = sweep.next_job()
+            if not job:
+                break
+
+            known = self._lookup(group, job)
+            if known is not None:
+                self._record(group, sweep, job, known, fresh=False)
+                continue
+
+            log.debug("Dispatching round %d of %s for n=%d",
+                      job.round + 1, sweep.name, job.size)
+            running[pool.submit(run_job, job)] = (group, sweep, job)
+            active[group] += 1
+
+    def _dispatch(self, pool, unfinished, running, active):
+        for group, sweep in unfinished:
+            if len(running) >= self.jobs:
+                break
+            self._dispatch_sweep(pool, group, sweep, running, active)
+
+    def _pull(self, pool, pending, unfinished, running, active):
+        """
+        Take new sweeps from the iterator pending and dispatch their
+        jobs, for as long as there is capacity to run them and fewer
+        than jobs sweeps are left waiting (on the limit of their group).
+        Sweeps are thus only created as they are needed.
+
+        Returns False once pending is exhausted.
+        """
+        while len(running) < self.jobs:
+            busy = {sweep for _, sweep, _ in running.values()}
+            waiting = sum(1 for _, sweep in unfinished if sweep not in busy)
+            if waiting >= self.jobs:
+                break
+
+            try:
+                group, sweep = next(pending)
+            except StopIteration:
+                return False
+
+            if self.progress:
+                self.progress.add(group, sweep)
+            self._dispatch_sweep(pool, group, sweep, running, active)
+            if sweep.finished:
+                # Entirely known from the journal or cache, most likely
+                self._finish(group, sweep)
+            else:
+                unfinished.append((group, sweep))
+
+        return True
+
+    def _finish(self, group, sweep):
+        self._nfinished += 1
+        log.info("Finished configuration %d/%s: %s",
+                 self._nfinished, self._total or "?", sweep.name)
+        if self.progress:
+            self.progress.finished(group, sweep)
+        if self._on_finished:
+            self._on_finished(group, sweep)
+
+    def _collect(self, done, running, active):
+        for future in done:
+            group, sweep, job = running.pop(future)
+            active[group] -= 1
+            try:
+                result = future.result()
+            except Exception as e:
+                log.error(("Error %s when executing command %s with"
+                           " arguments %s for experiment %s"),
+                          e, sweep.command, " ".join(sweep.args), group)
+                sweep.fail(e)
+                continue
+
+            if sweep.error:
+                # A sibling round failed, and the sweep has already been
+                # finished and handed over, so there is nothing to record
+                log.debug("Dropping round %d of failed %s for n=%d",
+                          job.round + 1, sweep.name, job.size)
+                continue
+
+            self._record(group, sweep, job, result)
+
+    def run(self, sweeps, on_finished=None, on_result=None, total=None):
+        """
+        Run (group, sweep) pairs from an iterable to completion. Sweeps
+        are taken from it as they can be run, and served in order, so
+        that it can be arbitrarily long if it is lazy (see _pull()).
+        on_finished(group, sweep) is called for each sweep as soon as it
+        is finished, and on_result(group, sweep, job, result) with the
+        result of every job. total is the number of sweeps, if known.
+        """
+        self._on_result = on_result
+        self._on_finished = on_finished
+        self._total = total or length_hint(sweeps) or None
+        self._nfinished = 0
+        pending = iter(sweeps)
+        more = True
+        unfinished = []
+        running = {}
+        active = defaultdict(int)
+        # Wake up now and then to report progress during long jobs
+        timeout = self.progress.interval_s if self.progress else None
+        if self.progress:
+            self.progress.start(self.jobs, self.limits)
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            while unfinished or more:
+                self._dispatch(pool, unfinished, running, active)
+                if more:
+                    more = self._pull(pool, pending, unfinished, running,
+                                      active)
+
+                if running:
+                    done, _ = wait(running, timeout=timeout,
+                                   return_when=FIRST_COMPLETED)
+                    self._collect(done, running, active)
+                else:
+                    assert more or all([sweep.finished
+                                        for _, sweep in unfinished]), \
+                        "No runnable jobs, but unfinished sweeps!"
+
+                still_running = []
+                for group, sweep in unfinished:
+                    if sweep.finished:
+                        self._finish(group, sweep)
+                    else:
+                        still_running.append((group, sweep))
+
+                unfinished = still_running
+                if self.progress:
+                    self.progress.update(len(running))
+
+        if self.progress:
+            self.progress.close()
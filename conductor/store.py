@@ -0,0 +1,216 @@
+from conductor.common import STATE_DIR, make_parent_dir
+from conductor.run_experiments import MEASUREMENTS
+
+from itertools import groupby
+import os
+import sqlite3
+
+import daiquiri
+
+log = daiquiri.getLogger()
+
+DEFAULT_STORE = os.path.join(STATE_DIR, "results.db")
+
+# The columns every result row has, and their types
+RESULT_COLUMNS = [('n', 'INTEGER'),
+                  ('runtime', 'REAL'),
+                  ('failures', 'INTEGER'),
+                  ('status', 'TEXT'),
+                  *[(measurement, 'REAL') for measurement in MEASUREMENTS]]
+
+SCHEMA = ["""CREATE TABLE IF NOT EXISTS configurations (
+               id INTEGER PRIMARY KEY,
+               experiment TEXT NOT NULL,
+               position INTEGER NOT NULL,
+               name TEXT NOT NULL)""",
+          """CREATE INDEX IF NOT EXISTS configurations_by_experiment
+               ON configurations (experiment, position)""",
+          # Values keep their type, as SQLite columns are dynamically typed
+          """CREATE TABLE IF NOT EXISTS options (
+               configuration INTEGER NOT NULL REFERENCES configurations (id),
+               option TEXT NOT NULL,
+               value,
+               PRIMARY KEY (configuration, option))""",
+          """CREATE INDEX IF NOT EXISTS options_by_value
+               ON options (option, value)""",
+          """CREATE TABLE IF NOT EXISTS results (
+               configuration INTEGER NOT NULL REFERENCES configurations (id),
+               {})""".format(",\n               ".join(
+                   ["{} {}".format(name, sql_type)
+                    for name, sql_type in RESULT_COLUMNS])),
+          """CREATE INDEX IF NOT EXISTS results_by_configuration
+               ON results (configuration, n)""",
+          # The raw measurements of every round
+          """CREATE TABLE IF NOT EXISTS rounds (
+               configuration INTEGER NOT NULL REFERENCES configurations (id),
+               round INTEGER NOT NULL,
+               {})""".format(",\n               ".join(
+                   ["{} {}".format(name, sql_type)
+                    for name, sql_type in RESULT_COLUMNS]))]
+
+
+def quote(identifier):
+    return '"{}"'.format(identifier.replace('"', '""'))
+
+
+class ResultStore(object):
+    """
+    The results of a run in a SQLite database: one row per configuration
+    (indexed by experiment), its option values, and one row per instance
+    size with typed columns for the runtime, failures, status,
+    measurements and captures. A column is added for each new capture.
+    The raw measurements of each round are kept the same way.
+    """
+
+    def __init__(self, path=DEFAULT_STORE, keep=False):
+        """
+        Unless keep is set, any earlier results in the database are
+        removed.
+        """
+        self.path = path
+        if path != ":memory:":
+            make_parent_dir(path)
+
+        self._db = sqlite3.connect(path)
+        self._db.row_factory = sqlite3.Row
+        for statement in SCHEMA:
+            self._db.execute(statement)
+
+        if not keep:
+            with self._db:
+                for table in ["rounds", "results", "options",
+                              "configurations"]:
+                    self._db.execute("DELETE FROM {}".format(table))
+
+        self._columns = {table: {row['name'] for row in self._db.execute(
+                             "PRAGMA table_info({})".format(table))}
+                         for table in ["results", "rounds"]}
+        self._positions = {}
+
+    def add_configuration(self, experiment, name, options):
+        """
+        Add a configuration of an experiment with its options, and
+        return its id. Configurations keep the order they are added in.
+        """
+        position = self._positions.get(experiment, 0)
+        self._positions[experiment] = position + 1
+
+        with self._db:
+            cursor = self._db.execute(
+                """INSERT INTO configurations (experiment, position, name)
+                   VALUES (?, ?, ?)""",
+                (experiment, position, name))
+            configuration = cursor.lastrowid
+            self._db.executemany(
+                "INSERT INTO options (configuration, option, value) VALUES (?, ?, ?)",
+                [(configuration, option, value)
+                 for option, value in options.items()])
+
+        return configuration
+
+    def _insert(self, table, row):
+        for name in row.keys():
+            if name not in self._columns[table]:
+                self._db.execute("ALTER TABLE {} ADD COLUMN {}"
+                                 .format(table, quote(name)))
+                self._columns[table].add(name)
+
+        self._db.execute(
+            "INSERT INTO {} ({}) VALUES ({})".format(
+                table,
+                ", ".join([quote(c) for c in row.keys()]),
+                ", ".join(["?"] * len(row))),
+            tuple(row.values()))
+
+    def add_results(self, configuration, results):
+        """
+        Add the result rows of a configuration, as returned by
+        Sweep.results().
+        """
+        with self._db:
+            for result in results:
+                self._insert("results", {'configuration': configuration,
+                                         **result})
+
+    def add_round(self, configuration, size, round_number, result):
+        """
+        Add the raw result of a single round. This is committed along
+        with the next results added (or when the store is closed), to not
+        pay for a transaction per round.
+        """
+        self._insert("rounds", {'configuration': configuration,
+                                'round': round_number,
+                                'n': size,
+                                **result})
+
+    def option_names(self):
+        return [row['option'] for row in self._db.execute(
+            "SELECT DISTINCT option FROM options ORDER BY option")]
+
+    def round_columns(self):
+        return [row['name'] for row in
+                self._db.execute("PRAGMA table_info(rounds)")
+                if row['name'] != 'configuration']
+
+    def rounds(self):
+        """
+        Generate the raw result of every round as a flat dict with the
+        experiment, configuration, option values, instance size, round
+        and measurements. Rows are read from the database as they are
+        generated.
+        """
+        option_names = self.option_names()
+        option_columns = ["""(SELECT value FROM options
+                               WHERE options.configuration = rounds.configuration
+                               AND option = ?) AS {}""".format(quote(name))
+                          for name in option_names]
+        columns = ["experiment", "name AS configuration", *option_columns,
+                   *["rounds.{}".format(quote(c)) for c in self.round_columns()]]
+        cursor = self._db.execute(
+            """SELECT {} FROM rounds
+               JOIN configurations ON configurations.id = rounds.configuration
+               ORDER BY configurations.id, n, round""".format(", ".join(columns)),
+            option_names)
+
+        for row in cursor:
+            yield {k: row[k] for k in row.keys()}
+
+    def _options(self, experiment):
+        rows = self._db.execute(
+            """SELECT configuration, option, value FROM options
+               JOIN configurations ON configurations.id = options.configuration
+               WHERE experiment = ?
+               ORDER BY configuration""",
+            (experiment,))
+        return {configuration: {row['option']: row['value'] for row in rows}
+                for configuration, rows
+                in groupby(rows, key=lambda row: row['configuration'])}
+
+    def configurations(self, experiments):
+        """
+        Generate (options, results) for each configuration of the given
+        experiments that has results, in the order they were added.
+        options is a dict of option values, and results a list of result
+        rows as dicts.
+        """
+        for experiment in experiments:
+            options = self._options(experiment)
+            rows = self._db.execute(
+                """SELECT results.* FROM results
+                   JOIN configurations ON configurations.id = results.configuration
+                   WHERE experiment = ?
+                   ORDER BY position, results.rowid""",
+                (experiment,))
+
+            for configuration, config_rows in groupby(
+                    rows, key=lambda row: row['configuration']):
+                results = [{k: row[k] for k in row.keys()
+                            if k != 'configuration' and row[k] is not None}
+                           for row in config_rows]
+                yield options[configuration], results
+
+    def close(self):
+        # Rounds added since the last results, e.g. those of failed
+        # configurations, are not committed yet
+        self._db.commit()
+        self._db.close()